@@ -4,6 +4,20 @@ import numpy as np
 from plotly.offline import plot
 
 
+def cobb_douglas_demand(incomes, prices, c, d, p2=1):
+    """
+    optimal bundle of a whole population of Cobb-Douglas consumers in one broadcasted call.
+    incomes, c and d hold one entry per consumer, prices one per consumer or one row per
+    consumer with a column per offer, such as a matrix of quotes. returns the quantities
+    of both goods and the utility, shaped like prices
+    """
+    prices = np.asarray(prices, dtype=float)
+    incomes, c, d = (np.asarray(x, dtype=float) for x in (incomes, c, d))
+    if prices.ndim == 2:
+        incomes, c, d = (x[..., np.newaxis] if x.ndim else x for x in (incomes, c, d))
+    return CobbDouglas(c, d).optimal_bundle(prices, p2, incomes)
+
+
 class CobbDouglas:
 
     def __init__(self, c, d):
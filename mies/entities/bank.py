@@ -1,38 +1,34 @@
 import datetime as dt
-import os
 import pandas as pd
 import sqlalchemy as sa
-from sqlalchemy.orm import sessionmaker
 
 import mies.schema.bank as bank
 from mies.schema.bank import Account, Customer, Insurer, Person, Transaction
 from mies.schema.bank import Bank as BankTable
-from mies.utilities.connections import connect_universe
+from mies.utilities.connections import SqliteMixin, connect_universe, truncate_tables
 from mies.utilities.queries import query_bank_id
 
 
-class Bank:
-    def __init__(self, starting_capital, bank_name, path='db/banks/', date_established=dt.datetime(1, 12, 31)):
-        if not os.path.exists(path):
-            os.makedirs(path)
-        self.engine = sa.create_engine(
-            'sqlite:///' + path + bank_name + '.db',
-            echo=True
-        )
-        session = sessionmaker(bind=self.engine)
-        bank.Base.metadata.create_all(self.engine)
-        self.session = session()
-        self.connection = self.engine.connect()
+class BaseBank:
+    """
+    keeps the accounts of people and companies and the transactions between them. backends
+    implement the underscored methods and the customer and account lookups, see Bank
+    """
+    def __init__(self, starting_capital, bank_name, date_established=dt.datetime(1, 12, 31)):
         self.name = bank_name
+        # counts account assignments, so that schedules built from the accounts know to rebuild
+        self.account_version = 0
         self.date_established = date_established
-        self.id = self.__register()
+        self.starting_capital = starting_capital
+        self.id = self._register()
         self.get_customers(self.id, 'bank')
+        customer_id = self.customers_by_type_id([self.id], 'bank').iat[0]
         self.cash_account = self.assign_account(
-            customer_id=self.id,
+            customer_id=customer_id,
             account_type='cash'
         )
-        self.capital_account = self.assign_account(self.id, 'capital')
-        self.liability_account = self.assign_account(self.id, 'liability')
+        self.capital_account = self.assign_account(customer_id, 'capital')
+        self.liability_account = self.assign_account(customer_id, 'liability')
         self.make_transaction(
             self.cash_account,
             self.capital_account,
@@ -40,7 +36,90 @@ class Bank:
             starting_capital
         )
 
-    def __register(self):
+    def _register(self):
+        raise NotImplementedError
+
+    def _write_accounts(self, customer_ids, account_type):
+        raise NotImplementedError
+
+    def _write_account(self, customer_id, account_type):
+        raise NotImplementedError
+
+    def _write_transactions(self, data):
+        raise NotImplementedError
+
+    def _remove_people(self):
+        raise NotImplementedError
+
+    def _clear_transactions(self):
+        raise NotImplementedError
+
+    def assign_accounts(self, customer_ids, account_type):
+        """
+        assign multiple accounts given customer ids
+        """
+        self._write_accounts(customer_ids, account_type)
+        self.account_version += 1
+
+    def assign_account(self, customer_id, account_type):
+        """
+        assign a single account for a customer
+        """
+        account_id = self._write_account(int(customer_id), account_type)
+        self.account_version += 1
+        return account_id
+
+    def reset(self, keep_people=True):
+        """
+        clear every transaction and post the bank's starting capital again. unless keep_people,
+        people are removed as customers along with their accounts, while the accounts
+        of the bank and its other customers keep their ids
+        """
+        if not keep_people:
+            self._remove_people()
+            self.account_version += 1
+        self._clear_transactions()
+        self.make_transaction(
+            self.cash_account,
+            self.capital_account,
+            self.date_established,
+            self.starting_capital
+        )
+
+    def make_transactions(self, data: pd.DataFrame):
+        """
+        accepts a DataFrame to make multiple transactions
+        need debit, credit, transaction date, transaction amount
+        """
+        data['debit_account'] = data['debit_account'].astype(int)
+        data['credit_account'] = data['credit_account'].astype(int)
+        self._write_transactions(data)
+
+
+class Bank(SqliteMixin, BaseBank):
+    """
+    bank whose books are kept in sqlite, in path + bank_name + '.db'
+    """
+    # schema table of each type of customer
+    customer_tables = {
+        'person': Person,
+        'insurer': Insurer,
+        'bank': BankTable
+    }
+
+    schema = bank.Base
+
+    def __init__(self, starting_capital, bank_name, path='db/banks/', date_established=dt.datetime(1, 12, 31)):
+        self.path = path
+        self.name = bank_name
+        self._connect()
+        super().__init__(starting_capital, bank_name, date_established)
+
+    @property
+    def database_path(self):
+        return self.path + self.name + '.db'
+
+    def _register(self):
         # populate universe company record
         insurer_table = pd.DataFrame([[self.name]], columns=['bank_name'])
         session, connection = connect_universe()
@@ -60,12 +139,9 @@ class Bank:
 
         objects = []
         for index, row in new_customers.iterrows():
-            if customer_type == 'person':
-                customer_type_table = Person(person_id=row[customer_type + '_id'])
-            elif customer_type == 'insurer':
-                customer_type_table = Insurer(insurer_id=row[customer_type + '_id'])
-            else:
-                customer_type_table = BankTable(bank_id=row[customer_type + '_id'])
+            customer_type_table = self.customer_tables[customer_type](**{
+                customer_type + '_id': row[customer_type + '_id']
+            })
 
             customer = Customer(
                 customer_type=customer_type
@@ -76,10 +152,39 @@ class Bank:
         self.session.add_all(objects)
         self.session.commit()
 
-    def assign_accounts(self, customer_ids, account_type):
+    def customers_by_type_id(self, ids, customer_type):
         """
-        assign multiple accounts given customer ids
+        customer id of each of the customers of customer_type with the given ids
+        """
+        table = self.customer_tables[customer_type]
+        customers = pd.read_sql(self.session.query(table).statement, self.connection)
+        return customers[customers[customer_type + '_id'].isin(ids)]['customer_id']
+
+    def accounts_by_type_id(self, ids, customer_type, account_type):
+        """
+        returns the type id, customer id and account id of each account of account_type
+        held by the customers of customer_type with the given ids
         """
+        table = self.customer_tables[customer_type]
+        accounts_query = self.session.query(
+            getattr(table, customer_type + '_id'),
+            table.customer_id,
+            Account.account_id
+        ).join(
+            Account,
+            table.customer_id == Account.customer_id
+        ).filter(
+            Account.account_type == account_type
+        ).statement
+
+        accounts = pd.read_sql(
+            accounts_query,
+            self.connection
+        )
+
+        return accounts[accounts[customer_type + '_id'].isin(ids)]
+
+    def _write_accounts(self, customer_ids, account_type):
         new_accounts = pd.DataFrame()
         new_accounts['customer_id'] = customer_ids
         new_accounts['account_type'] = account_type
@@ -91,15 +196,25 @@ class Bank:
             if_exists='append'
         )
 
-    def assign_account(self, customer_id, account_type):
-        """
-        assign a single account for a customer
-        """
-        account = Account(customer_id=int(customer_id), account_type=account_type)
+    def _write_account(self, customer_id, account_type):
+        account = Account(customer_id=customer_id, account_type=account_type)
         self.session.add(account)
         self.session.commit()
         return account.account_id
 
+    def _remove_people(self):
+        with self.connection.begin():
+            self.connection.execute(sa.text(
+                "DELETE FROM account WHERE customer_id IN "
+                "(SELECT customer_id FROM customer WHERE customer_type = 'person')"
+            ))
+            self.connection.execute(sa.text("DELETE FROM customer WHERE customer_type = 'person'"))
+            self.connection.execute(sa.text('DELETE FROM person'))
+
+    def _clear_transactions(self):
+        truncate_tables(self.connection, ['transaction'])
+        self.session.expunge_all()
+
     def make_transaction(self, debit_account, credit_account, transaction_date, transaction_amount):
         """
         make a single transaction
@@ -114,17 +229,10 @@ class Bank:
         self.session.commit()
         return transaction.transaction_id
 
-    def make_transactions(self, data: pd.DataFrame):
-        """
-        accepts a DataFrame to make multiple transactions
-        need debit, credit, transaction date, transaction amount
-        """
-        data['debit_account'] = data['debit_account'].astype(int)
-        data['credit_account'] = data['credit_account'].astype(int)
+    def _write_transactions(self, data):
         data.to_sql(
             'transaction',
             self.connection,
             index=False,
             if_exists='append'
         )
-
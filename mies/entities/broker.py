@@ -2,237 +2,292 @@ import numpy as np
 import pandas as pd
 import datetime
 
-from random import choices
 from parameters import INITIAL_PREMIUM
 
-from mies.entities.bank import Bank
-from mies.schema.insco import Claim, ClaimTransaction
-from mies.utilities.connections import(
-    connect_company
-)
+from sqlalchemy.dialects.sqlite import insert
+
+from mies.entities.bank import BaseBank
+from mies.models.market import logit_choice, quote_matrix, select_quotes, take_up
+from mies.schema.insco import Claim, ClaimTransaction, Customer, Policy
+from mies.utilities.connections import company_scope
+from mies.utilities.coverage import CoverageIndex
 from mies.utilities.queries import (
-    get_company_names,
-    get_customer_ids,
-    get_uninsured_ids,
     query_company,
-    query_all_policies,
-    query_accounts_by_company_id,
-    query_accounts_by_person_id,
-    query_events_by_report_date,
-    query_in_force_policies,
-    query_population
+    query_events_by_report_day,
+    query_free_business,
+    query_policies_in_force_between
 )
 
 
-class Broker:
+class BaseBroker:
+    """
+    places business with the insurer quoting the lowest premium, breaking ties
+    at random or, with tie_break='first', in favour of the first insurer. with
+    consumer_choice, people only buy the policy if their demand for insurance at
+    its premium comes to take_up_threshold policies, see mies.models.market.take_up. given an
+    executor, insurers quote renewals concurrently, see mies.models.market.quote_matrix.
+    with placement='logit', renewals go to an insurer drawn with multinomial logit
+    probabilities instead, see mies.models.market.logit_choice. the initial placement, ties
+    and logit choices are drawn with the broker's own generator, seeded with seed
+    """
+    def __init__(
+        self,
+        tie_break='random',
+        consumer_choice=False,
+        executor=None,
+        placement='cheapest',
+        price_sensitivity=10.,
+        loyalty=0.,
+        seed=None,
+        take_up_threshold=1.
+    ):
+        if placement not in ('cheapest', 'logit'):
+            raise ValueError('unknown placement: %s' % placement)
+        self.rng = np.random.default_rng(seed)
+        self.tie_break = tie_break
+        self.consumer_choice = consumer_choice
+        self.take_up_threshold = take_up_threshold
+        self.executor = executor
+        self.placement = placement
+        self.price_sensitivity = price_sensitivity
+        self.loyalty = loyalty
+        # day ordinal through which reported events have been turned into claims
+        self.reported_through = 0
+
+    def __getstate__(self):
+        # an executor does not survive pickling, a restored broker quotes serially
+        state = self.__dict__.copy()
+        state['executor'] = None
+        return state
+
+    def reset(self, seed=None):
+        """
+        forget which events have been reported, for a fresh run over a cleared event table.
+        seed reseeds the generator
+        """
+        self.reported_through = 0
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
 
     def identify_free_business(
             self,
-            curr_date
+            curr_date,
+            connection=None,
+            company_connections=None
     ):
-        # get expiring policies for each company
-        market = query_in_force_policies(curr_date)
+        raise NotImplementedError
 
-        # get people with no policy
-        new_business = pd.DataFrame(get_uninsured_ids(curr_date))
+    def _read_companies(self, connection):
+        raise NotImplementedError
 
-        market = market.append(new_business)
+    def _read_reported_events(self, start_day, end_day, connection):
+        raise NotImplementedError
 
-        return market
+    def _read_policies_between(self, start_date, end_date, connection, company_connections):
+        raise NotImplementedError
+
+    def _write_placements(self, company_name, new_business, company_connections):
+        raise NotImplementedError
+
+    def _write_claims(self, company_name, reported_claims, company_connections):
+        raise NotImplementedError
 
     def place_business(
             self,
             curr_date,
-            bank: Bank,
-            *args
+            bank: BaseBank,
+            *args,
+            connection=None
     ):
-        free_business = self.identify_free_business(curr_date)
-        population = query_population()
-        free_business = free_business.merge(population, on='person_id', how='left')
+        company_connections = {arg.company_name: arg.connection for arg in args}
+        free_business = self.identify_free_business(curr_date, connection, company_connections)
         # determine market status
         if sum(free_business['policy_id'].notnull()) == 0:
             market_status = 'initial_pricing'
         else:
             market_status = 'renewal'
 
-        companies = query_company()
+        companies = self._read_companies(connection)
 
         if market_status == 'initial_pricing':
-            free_business['company_id'] = choices(
-                companies.company_id,
-                k=len(free_business)
+            free_business['company_id'] = self.rng.choice(
+                companies['company_id'].values,
+                size=len(free_business)
             )
             free_business['premium'] = INITIAL_PREMIUM
             free_business['effective_date'] = curr_date + datetime.timedelta(1)
             free_business['expiration_date'] = curr_date.replace(curr_date.year + 1)
 
         else:
-            for arg in args:
-                free_business['effective_date'] = curr_date + datetime.timedelta(1)
-                free_business['expiration_date'] = curr_date.replace(curr_date.year + 1)
-                free_business['rands'] = np.random.uniform(len(free_business))
-                free_business['quote_' + str(arg.id)] = arg.pricing_model.predict(free_business)
-
-            free_business['premium'] = free_business[free_business.columns[pd.Series(
-                free_business.columns).str.startswith('quote_')]].min(axis=1)
-            free_business['company_id'] = free_business[free_business.columns[pd.Series(
-                free_business.columns).str.startswith('quote_')]].idxmin(axis=1).str[-1]
-            free_business['company_id'] = free_business['company_id'].astype('int')
-
-        for company in companies.company_id:
-            company_name = companies[companies['company_id'] == company]['company_name']
-            company_name = company_name.squeeze()
-            new_business = free_business[free_business['company_id'] == company]
-            new_policies = new_business[[
-                'person_id',
-                'effective_date',
-                'expiration_date',
-                'premium'
-            ]]
-
-            customer = new_business[[
-                'person_id',
-                'age_class',
-                'profession',
-                'health_status',
-                'education_level'
-
-            ]]
-
-            existing_customers = get_customer_ids(company_name)
-            new_customers = customer[~customer['person_id'].isin(existing_customers['person_id'])]
-
-            session, connection = connect_company(company_name)
-
-            # populate the policy table
-            new_policies.to_sql(
-                'policy',
-                connection,
-                index=False,
-                if_exists='append'
-            )
-
-            # populate the customer table
-            new_customers.to_sql(
-                'customer',
-                connection,
-                index=False,
-                if_exists='append'
-            )
-            connection.close()
-
-            # prepare transactions
-            transactions = new_policies[[
-                'person_id',
-                'premium'
-            ]]
-
-            transactions = transactions.rename(columns={'premium': 'transaction_amount'})
-
-            person_ids = transactions['person_id']
-
-            person_accounts = query_accounts_by_person_id(
-                person_ids,
-                bank.name,
-                'cash'
-            )
-
-            person_accounts = person_accounts.rename(columns={'account_id': 'credit_account'})
-
-            transactions = transactions.merge(
-                person_accounts,
-                on='person_id',
-                how='left'
-            )
-
-            transactions['transaction_date'] = curr_date
-
-            company_account = query_accounts_by_company_id(
-                [company],
-                bank.name,
-                'cash'
-            )
-
-            company_account = company_account['account_id'].squeeze()
-
-            transactions['debit_account'] = company_account
-
-            transactions = transactions[[
-                'debit_account',
-                'credit_account',
-                'transaction_date',
-                'transaction_amount'
-            ]]
-
-            bank.make_transactions(transactions)
-
-    def report_claims(self, report_date):
-        # match events to policies in which they are covered
-
-        events = query_events_by_report_date(report_date)
+            free_business['effective_date'] = curr_date + datetime.timedelta(1)
+            free_business['expiration_date'] = curr_date.replace(curr_date.year + 1)
 
-        policies = query_all_policies()
+            quotes = quote_matrix(free_business, args, self.executor)
+            if self.placement == 'logit':
+                free_business['premium'], free_business['company_id'] = logit_choice(
+                    quotes,
+                    [arg.id for arg in args],
+                    free_business['incumbent_id'].values,
+                    self.price_sensitivity,
+                    self.loyalty,
+                    self.rng
+                )
+            else:
+                free_business['premium'], free_business['company_id'] = select_quotes(
+                    quotes,
+                    [arg.id for arg in args],
+                    self.tie_break,
+                    self.rng
+                )
 
-        claims = events.merge(
-            policies,
+        free_business = free_business[free_business['company_id'].isin(companies['company_id'])]
+        if self.consumer_choice:
+            free_business = free_business[take_up(
+                free_business,
+                free_business['premium'].values,
+                self.take_up_threshold
+            )]
+
+        # every account involved in the placement is resolved at once
+        person_accounts = bank.accounts_by_type_id(free_business['person_id'], 'person', 'cash')
+        free_business = free_business.merge(
+            person_accounts[['person_id', 'account_id']],
             on='person_id',
             how='left'
         )
-        claims = claims.query(
-            'event_date >= effective_date '
-            'and event_date <= expiration_date'
+        company_accounts = bank.accounts_by_type_id(
+            companies['company_id'],
+            'insurer',
+            'cash'
+        ).set_index('insurer_id')['account_id']
+
+        for company_id, new_business in free_business.groupby('company_id', sort=False):
+            company_name = companies.loc[companies['company_id'] == company_id, 'company_name'].squeeze()
+            self._write_placements(company_name, new_business, company_connections)
+
+        # premiums are posted as one batch
+        bank.make_transactions(pd.DataFrame({
+            'debit_account': company_accounts.reindex(free_business['company_id']).values,
+            'credit_account': free_business['account_id'].values,
+            'transaction_date': curr_date,
+            'transaction_amount': free_business['premium'].values
+        }))
+
+    def report_claims(self, through_date, *args, connection=None):
+        # match the events reported after the watermark through through_date to policies in which they are covered
+        start_day, end_day = self.reported_through + 1, through_date.toordinal()
+        if end_day < start_day:
+            return
+        self.reported_through = end_day
+
+        events = self._read_reported_events(start_day, end_day, connection)
+        if events.empty:
+            return
+
+        # only the policies in force when the reported events occurred can cover them
+        company_connections = {arg.company_name: arg.connection for arg in args}
+        policies = self._read_policies_between(
+            events['event_date'].min(),
+            events['event_date'].max(),
+            connection,
+            company_connections
         )
 
-        claims = claims.drop([
-            'effective_date',
-            'expiration_date',
-            'premium',
-            'company_id'
-        ], axis=1)
-
-        companies = get_company_names()
-
-        for company in companies:
-
-            # register claims by id
-
-            reported_claims = claims[claims['company_name'] == company]
+        claims = CoverageIndex(policies).match(events)
 
+        for company_name in self._read_companies(connection)['company_name']:
+            reported_claims = claims[claims['company_name'] == company_name]
             reported_claims = reported_claims.rename(columns={
                 'event_date': 'occurrence_date'
             })
+            self._write_claims(company_name, reported_claims, company_connections)
 
-            reported_claims = reported_claims.drop(['company_name'], axis=1)
 
-            session, connection = connect_company(company)
-
-            objects = []
-            for index, row in reported_claims.iterrows():
-                claim = Claim(
-                    policy_id=row['policy_id'],
-                    person_id=row['person_id'],
-                    event_id=row['event_id'],
-                    occurrence_date=row['occurrence_date'],
-                    report_date=row['report_date']
-                )
-                open_claim = ClaimTransaction(
-                    transaction_date=row['report_date'],
-                    transaction_type='open claim',
-                    transaction_amount=0
-                )
-                case_reserve = ClaimTransaction(
-                    transaction_date=row['report_date'],
-                    transaction_type='set case reserve',
-                    transaction_amount=row['ground_up_loss']
-                )
-                claim.claim_transaction.append(open_claim)
-                claim.claim_transaction.append(case_reserve)
-                objects.append(claim)
+class Broker(BaseBroker):
+    """
+    broker for a universe kept in sqlite. the universe is read through the connection passed
+    to place_business and report_claims, and each company through the connection of the insurer
+    passed for it, so that the broker reads and writes inside the transactions held on them.
+    other companies and a missing universe connection get a connection of their own for the
+    duration of the call
+    """
+    def identify_free_business(
+            self,
+            curr_date,
+            connection=None,
+            company_connections=None
+    ):
+        # expiring policies and people with no policy, with their attributes
+        return query_free_business(curr_date, connection, company_connections)
 
-            session.add_all(objects)
-            session.commit()
+    def _read_companies(self, connection):
+        return query_company(connection)
 
-            connection.close()
+    def _read_reported_events(self, start_day, end_day, connection):
+        return query_events_by_report_day(start_day, end_day, connection)
 
+    def _read_policies_between(self, start_date, end_date, connection, company_connections):
+        return query_policies_in_force_between(start_date, end_date, connection, company_connections)
 
+    def _write_placements(self, company_name, new_business, company_connections):
+        new_policies = new_business[[
+            'person_id',
+            'effective_date',
+            'expiration_date',
+            'premium',
+            'age_class',
+            'profession',
+            'health_status',
+            'education_level',
+            'risk_cell'
+        ]]
+
+        customer = new_business[[
+            'person_id',
+            'age_class',
+            'profession',
+            'health_status',
+            'education_level',
+            'risk_cell'
+        ]]
+
+        # policies and customers are written in one transaction. existing customers are given the
+        # attributes they are placed with, which population dynamics may have changed since
+        upsert = insert(Customer.__table__)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=['person_id'],
+            set_={column: upsert.excluded[column] for column in customer.columns if column != 'person_id'}
+        )
+        with company_scope(company_name, company_connections.get(company_name)) as (session, connection):
+            with connection.begin():
+                connection.execute(Policy.__table__.insert(), new_policies.to_dict('records'))
+                connection.execute(upsert, customer.to_dict('records'))
+
+    def _write_claims(self, company_name, reported_claims, company_connections):
+        # register claims by id
+        objects = []
+        for index, row in reported_claims.iterrows():
+            claim = Claim(
+                policy_id=row['policy_id'],
+                person_id=row['person_id'],
+                event_id=row['event_id'],
+                occurrence_date=row['occurrence_date'],
+                report_date=row['report_date']
+            )
+            open_claim = ClaimTransaction(
+                transaction_date=row['report_date'],
+                transaction_type='open claim',
+                transaction_amount=0
+            )
+            case_reserve = ClaimTransaction(
+                transaction_date=row['report_date'],
+                transaction_type='set case reserve',
+                transaction_amount=row['ground_up_loss']
+            )
+            claim.claim_transaction.append(open_claim)
+            claim.claim_transaction.append(case_reserve)
+            objects.append(claim)
 
+        with company_scope(company_name, company_connections.get(company_name)) as (session, connection):
+            session.add_all(objects)
+            session.commit()
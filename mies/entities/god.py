@@ -1,162 +1,451 @@
-import os
+import datetime as dt
+import numpy as np
 import pandas as pd
 import parameters as pm
 import sqlalchemy as sa
 import schema.universe as universe
 import shutil
 
-from sqlalchemy.orm import sessionmaker
-from scipy.stats import gamma
 from scipy.stats import pareto
-from numpy.random import poisson
 
-from mies.entities.bank import Bank
-from mies.utilities.queries import query_population, query_accounts_by_person_id, query_incomes
+from mies.entities.bank import BaseBank
+from mies.models.catastrophe import build_catastrophe_model
+from mies.models.dynamics import build_transitions, step_population
+from mies.models.losses import build_frequency_model, build_lag_model, build_severity_model
+from mies.models.samplers import build_samplers, draw_attributes
+from mies.utilities.connections import SqliteMixin, truncate_tables
+from mies.utilities.queries import (
+    query_exposure,
+    query_incomes,
+    query_person_state
+)
 
 
-class God:
+# number of people drawn and written at a time by make_population
+CHUNK_SIZE = 100000
+
+
+def generate_population(n_people, rng, samplers, chunk_size=CHUNK_SIZE):
+    """
+    yield n_people people in frames of at most chunk_size, with every attribute
+    drawn as a numpy array by samplers, see mies.models.samplers
+    """
+    for start in range(0, n_people, chunk_size):
+        size = min(chunk_size, n_people - start)
+        attributes = draw_attributes(size, rng, samplers)
+        codes = [attributes.pop(factor) for factor in pm.RATING_FACTORS]
+
+        population = pd.DataFrame({
+            factor: pm.decode_levels(code, factor)
+            for factor, code in zip(pm.RATING_FACTORS, codes)
+        })
+        population['risk_cell'] = pm.encode_risk_cells(codes)
+        for attribute, values in attributes.items():
+            population[attribute] = values
+        population['exit_date'] = None
+
+        yield population
+
+
+def days_to_dates(days):
+    """
+    dates of an array of day ordinals, converting each distinct day only once
+    """
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    dates = np.empty(len(unique_days), dtype=object)
+    dates[:] = [dt.date.fromordinal(int(day)) for day in unique_days]
+    return dates[inverse]
+
+
+def draw_events(
+        population,
+        event_dates,
+        rng,
+        frequency_model,
+        severity_model,
+        lag_model=None,
+        period_days=None,
+        frequency_loadings=None,
+        severity_loadings=None
+):
+    """
+    draw the events of every person in population for each date in event_dates in one
+    vectorized call, as a T x N matrix of frequencies and one flattened array of severities.
+    events occur on their event date, or on a uniformly drawn day of the period_days days
+    starting there, and are reported after a delay drawn by lag_model. frequencies and
+    severities are multiplied by T x N_CELLS loadings if given, see mies.models.catastrophe.
+    returns the events along with the index into event_dates of the period of each event
+    """
+    cells = pm.get_risk_cells(population)
+    if frequency_loadings is None:
+        frequency = frequency_model.sample(cells, len(event_dates), rng)
+    else:
+        frequency = frequency_model.sample(cells, len(event_dates), rng, frequency_loadings)
+
+    period, person = np.nonzero(frequency)
+    counts = frequency[period, person]
+    period = np.repeat(period, counts)
+    person = np.repeat(person, counts)
+
+    ground_up_loss = severity_model.sample(cells[person], rng)
+    if severity_loadings is not None:
+        ground_up_loss = ground_up_loss * severity_loadings[period, cells[person]]
+
+    event_day = np.array([event_date.toordinal() for event_date in event_dates], dtype=np.int64)[period]
+    if period_days is not None:
+        event_day = event_day + rng.integers(0, period_days, size=len(event_day))
+    report_day = event_day
+    if lag_model is not None:
+        report_day = event_day + lag_model.sample(len(event_day), rng)
+
+    events = pd.DataFrame({
+        'event_date': days_to_dates(event_day),
+        'report_date': days_to_dates(report_day),
+        'event_day': event_day,
+        'report_day': report_day,
+        'person_id': population['person_id'].values[person],
+        'ground_up_loss': ground_up_loss
+    })
+    return events, period
+
+
+def split_events(events, period, event_dates):
+    """
+    hand out a batch of events drawn by draw_events to the event date of each period
+    """
+    order = np.argsort(period, kind='stable')
+    bounds = np.searchsorted(period[order], np.arange(len(event_dates) + 1))
+    return {
+        event_date: events.iloc[order[bounds[i]:bounds[i + 1]]].reset_index(drop=True)
+        for i, event_date in enumerate(event_dates)
+    }
+
+
+def post_payroll(payroll, bank, transaction_date):
+    """
+    post a payroll schedule, the account_id and amount arrays built by God.get_payroll,
+    to bank as one batch of transactions
+    """
+    bank.make_transactions(pd.DataFrame({
+        'debit_account': payroll['account_id'],
+        'credit_account': bank.liability_account,
+        'transaction_date': transaction_date,
+        'transaction_amount': payroll['amount']
+    }))
+
+
+class BaseGod:
     """
     The supreme entity, overseer of all space, time, matter and energy, ruler of all unexplained variance.
+    seed seeds the generator people and losses are drawn with. samplers configures how
+    their attributes are drawn, and frequency_model, severity_model, report_lag and
+    catastrophes how their losses are, and dynamics how the population changes between
+    periods, defaulting to the configurations in parameters. with period_days, events are
+    spread over the period_days days starting at the date passed to smite.
+    backends implement the underscored methods, see God and mies.entities.memory
     """
-    def __init__(self):
-        if not os.path.exists('db'):
-            os.makedirs('db')
-        self.engine = sa.create_engine(
-            'sqlite:///db/universe.db',
-            echo=True
-        )
-        session = sessionmaker(bind=self.engine)
-        universe.Base.metadata.create_all(self.engine)
-        self.session = session()
-        self.connection = self.engine.connect()
+    def __init__(
+            self,
+            seed=None,
+            samplers=None,
+            frequency_model=None,
+            severity_model=None,
+            report_lag=None,
+            period_days=None,
+            catastrophes=None,
+            dynamics=None
+    ):
+        self.rng = np.random.default_rng(seed)
+        if samplers is None:
+            samplers = pm.population_samplers
+        self.samplers = build_samplers(samplers)
+        self.transitions = build_transitions(pm.population_dynamics if dynamics is None else dynamics)
+        self.set_loss_models(frequency_model, severity_model, report_lag, catastrophes)
+        self.period_days = period_days
+        # the perils that struck, by event date
+        self.strikes = pd.DataFrame(columns=['event_date', 'peril'])
+        # person ids and risk cells of the population, kept between periods until the population changes
+        self.exposure = None
+        # counts changes to the population, so that schedules derived from it know to rebuild
+        self.population_version = 0
+        # payroll schedule of each bank, with the population and accounts it was built from
+        self.payroll = {}
+        # events drawn ahead of time by foresee, keyed by event date
+        self.fate = {}
 
-    def make_person(self):
-        self.make_population(1)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['exposure'] = None
+        return state
+
+    def _write_people(self, population):
+        raise NotImplementedError
+
+    def _update_people(self, updates):
+        raise NotImplementedError
+
+    def _exit_people(self, person_ids, exit_date):
+        raise NotImplementedError
+
+    def _read_exposure(self):
+        raise NotImplementedError
+
+    def _read_person_state(self):
+        raise NotImplementedError
+
+    def _read_incomes(self, person_ids):
+        raise NotImplementedError
 
-    def make_population(self, n_people):
-        age_class = pm.draw_ac(n_people)
-        profession = pm.draw_prof(n_people)
-        health_status = pm.draw_hs(n_people)
-        education_level = pm.draw_el(n_people)
-        income = pareto.rvs(
-            b=1,
-            scale=pm.person_params['income'],
-            size=n_people,
+    def _write_events(self, events):
+        raise NotImplementedError
+
+    def _clear(self, keep_population):
+        raise NotImplementedError
+
+    def set_loss_models(self, frequency_model=None, severity_model=None, report_lag=None, catastrophes=None):
+        """
+        build the loss models, whose per risk cell parameters are computed once here
+        and reused every period. call again after changing the loss parameters
+        """
+        self.frequency_model = build_frequency_model(frequency_model or pm.frequency_model)
+        self.severity_model = build_severity_model(severity_model or pm.severity_model)
+        self.lag_model = build_lag_model(report_lag or pm.report_lag)
+        self.catastrophe_model = build_catastrophe_model(pm.catastrophes if catastrophes is None else catastrophes)
+
+    def draw_events(self, event_dates):
+        return draw_events(
+            self.get_exposure(),
+            event_dates,
+            self.rng,
+            self.frequency_model,
+            self.severity_model,
+            self.lag_model,
+            self.period_days,
+            *self.draw_catastrophes(event_dates)
         )
-        cobb_c = [pm.person_params['cobb_c']] * n_people
-        cobb_d = [pm.person_params['cobb_d']] * n_people
-
-        population = pd.DataFrame(list(
-            zip(
-                age_class,
-                profession,
-                health_status,
-                education_level,
-                income,
-                cobb_c,
-                cobb_d
-            )
-        ), columns=[
-            'age_class',
-            'profession',
-            'health_status',
-            'education_level',
-            'income',
-            'cobb_c',
-            'cobb_d'
-        ])
 
-        population.to_sql(
-            'person',
-            self.connection,
-            index=False,
-            if_exists='append'
+    def draw_catastrophes(self, event_dates):
+        """
+        draw the perils that strike each period and record them in strikes. returns
+        the frequency and severity loadings they add up to, or none without perils
+        """
+        if self.catastrophe_model is None:
+            return None, None
+        strikes, frequency_loadings, severity_loadings = self.catastrophe_model.sample(len(event_dates), self.rng)
+        self.strikes = pd.concat(
+            [self.strikes, self.catastrophe_model.strike_frame(strikes, event_dates)],
+            ignore_index=True
         )
+        return frequency_loadings, severity_loadings
+
+    def get_exposure(self):
+        if self.exposure is None:
+            self.exposure = self._read_exposure()
+        return self.exposure
+
+    def make_person(self):
+        self.make_population(1)
+
+    def make_population(self, n_people, chunk_size=CHUNK_SIZE):
+        """
+        create and persist n_people people, chunk_size at a time, so that
+        peak memory does not grow with the size of the population
+        """
+        for population in generate_population(n_people, self.rng, self.samplers, chunk_size):
+            self._write_people(population)
+        self.exposure = None
+        self.population_version += 1
 
     def grant_wealth(
             self,
             person_ids,
-            bank: Bank,
+            bank: BaseBank,
             transaction_date
     ):
         """
         assign an initial amount of starting wealth per person
         """
-        accounts = query_accounts_by_person_id(
-            person_ids,
-            bank.name,
-            'cash'
-        )
-        accounts['transaction_amount'] = pareto.rvs(
-            b=1,
-            scale=pm.person_params['income'],
-            size=accounts.shape[0],
-        )
-        accounts = accounts[[
-            'account_id',
-            'transaction_amount'
-        ]]
-        accounts = accounts.rename(columns={
-            'account_id': 'debit_account'
-        })
-        accounts['credit_account'] = bank.liability_account
-        accounts['transaction_date'] = transaction_date
-        bank.make_transactions(accounts)
+        accounts = bank.accounts_by_type_id(person_ids, 'person', 'cash')
+        bank.make_transactions(pd.DataFrame({
+            'debit_account': accounts['account_id'].values,
+            'credit_account': bank.liability_account,
+            'transaction_date': transaction_date,
+            'transaction_amount': pareto.rvs(
+                b=1,
+                scale=pm.person_params['income'],
+                size=accounts.shape[0],
+            )
+        }))
 
-    def send_paychecks(self, person_ids, bank: Bank, transaction_date):
-        incomes = query_incomes(person_ids)
-        incomes.columns = ['person_id', 'transaction_amount']
+    def get_payroll(self, person_ids, bank: BaseBank):
+        """
+        cash account and income of each person in person_ids, as arrays ready to be posted.
+        built once and reused until the population, the bank's accounts or person_ids change
+        """
+        person_ids = np.asarray(person_ids)
+        key = (self.population_version, bank.account_version)
+        if bank.name in self.payroll:
+            built_key, built_ids, payroll = self.payroll[bank.name]
+            if built_key == key and np.array_equal(built_ids, person_ids):
+                return payroll
 
-        accounts = query_accounts_by_person_id(
-            person_ids,
-            bank.name,
-            'cash'
-        )
+        incomes = self._read_incomes(person_ids)
+
+        accounts = bank.accounts_by_type_id(person_ids, 'person', 'cash')
 
         accounts = accounts.merge(incomes, on='person_id', how='left')
 
-        accounts = accounts.rename(columns={
-            'account_id': 'debit_account'
-        })
-        accounts['credit_account'] = bank.liability_account
-        accounts['transaction_date'] = transaction_date
-        accounts = accounts.drop([
-            'person_id',
-            'customer_id'
-        ], axis=1)
-        bank.make_transactions(accounts)
+        payroll = {
+            'person_id': accounts['person_id'].values,
+            'account_id': accounts['account_id'].values.astype(int),
+            'amount': accounts['income'].values.astype(float)
+        }
+        self.payroll[bank.name] = (key, person_ids, payroll)
+        return payroll
+
+    def send_paychecks(self, person_ids, bank: BaseBank, transaction_date):
+        post_payroll(self.get_payroll(person_ids, bank), bank, transaction_date)
+
+    def evolve(self, transition_date):
+        """
+        step the population through the transitions: changed attributes are updated in place,
+        leavers are given an exit date and entrants are appended. the exposure and payroll
+        schedules are patched rather than rebuilt where they can be, and events foreseen for a
+        population that no longer exists are forgotten. returns the ids of entrants and leavers
+        """
+        if not self.transitions:
+            return np.array([], dtype=int), np.array([], dtype=int)
+
+        updates, leavers, n_entrants = step_population(self._read_person_state(), self.transitions, self.rng)
+
+        if len(updates):
+            self._update_people(updates)
+        if len(leavers):
+            self._exit_people(leavers, transition_date)
+
+        exposure = self.exposure
+        if n_entrants:
+            self.make_population(n_entrants)
+        elif len(leavers):
+            self.exposure = None
+            self.population_version += 1
+        elif exposure is not None and 'risk_cell' in updates:
+            rows = pd.Index(exposure['person_id']).get_indexer(updates['person_id'])
+            exposure.iloc[rows, exposure.columns.get_loc('risk_cell')] = updates['risk_cell'].values
+
+        if 'income' in updates:
+            for _, _, payroll in self.payroll.values():
+                rows = pd.Index(payroll['person_id']).get_indexer(updates['person_id'])
+                found = rows >= 0
+                payroll['amount'][rows[found]] = updates['income'].values[found]
+
+        if n_entrants or len(leavers) or 'risk_cell' in updates:
+            self.forget()
+
+        entrants = np.array([], dtype=int)
+        if n_entrants:
+            # entrants are given the largest ids
+            entrants = np.sort(self.get_exposure()['person_id'].values)[-n_entrants:]
+        return entrants, leavers
+
+    def forget(self):
+        """
+        drop the events foreseen for dates that have not come yet, along with their strikes
+        """
+        if self.fate:
+            self.strikes = self.strikes[~self.strikes['event_date'].isin(list(self.fate))]
+            self.fate = {}
+
+    def foresee(self, event_dates):
+        """
+        draw the events of every period in event_dates at once, to be handed
+        out by smite as each date comes up
+        """
+        events, period = self.draw_events(event_dates)
+        self.fate.update(split_events(events, period, event_dates))
 
     def smite(
         self,
         ev_date
     ):
+        if ev_date in self.fate:
+            events = self.fate.pop(ev_date)
+        else:
+            events, period = self.draw_events([ev_date])
 
-        population = query_population()
+        self._write_events(events)
+        return events
 
-        population['lambda'] = pm.get_poisson_lambda(population)
-        population['frequency'] = poisson(population['lambda'])
+    def reset(self, keep_population=True, seed=None):
+        """
+        clear the events, and unless keep_population the people, without recreating the
+        universe, so that another run can start from the same universe. seed reseeds the generator
+        """
+        self._clear(keep_population)
+        self.fate = {}
+        self.strikes = self.strikes.iloc[:0]
+        if not keep_population:
+            self.exposure = None
+            self.population_version += 1
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
 
-        population = population[population['frequency'] != 0]
-        population['event_date'] = ev_date
-        # claims reported immediately for now
-        population['report_date'] = ev_date
 
-        population = population.loc[population.index.repeat(population.frequency)].copy()
+class God(SqliteMixin, BaseGod):
+    """
+    god of a universe kept in sqlite, in db/universe.db
+    """
+    schema = universe.Base
+    database_path = 'db/universe.db'
 
-        population['gamma_scale'] = pm.get_gamma_scale(population)
-        population['ground_up_loss'] = gamma.rvs(
-            a=2,
-            scale=population['gamma_scale']
-        )
+    def __init__(self, *args, **kwargs):
+        self._connect()
+        super().__init__(*args, **kwargs)
 
-        population = population[['event_date', 'report_date', 'person_id', 'ground_up_loss']]
+    def _write_people(self, population):
         population.to_sql(
+            'person',
+            self.connection,
+            index=False,
+            if_exists='append'
+        )
+
+    def _update_people(self, updates):
+        columns = [column for column in updates.columns if column != 'person_id']
+        self.connection.execute(
+            sa.text('UPDATE person SET %s WHERE person_id = :person_id' % ', '.join(
+                '%s = :%s' % (column, column) for column in columns
+            )),
+            updates.to_dict('records')
+        )
+
+    def _exit_people(self, person_ids, exit_date):
+        self.connection.execute(
+            sa.text('UPDATE person SET exit_date = :exit_date WHERE person_id = :person_id'),
+            [{'exit_date': exit_date, 'person_id': int(person_id)} for person_id in person_ids]
+        )
+
+    def _read_exposure(self):
+        return query_exposure(self.connection)
+
+    def _read_person_state(self):
+        return query_person_state(self.connection)
+
+    def _read_incomes(self, person_ids):
+        return query_incomes(person_ids, self.connection)
+
+    def _write_events(self, events):
+        events.to_sql(
             'event',
             self.connection,
             index=False,
             if_exists='append'
         )
-        return population
+
+    def _clear(self, keep_population):
+        tables = ['event'] if keep_population else ['event', 'person']
+        truncate_tables(self.connection, tables)
+        self.session.expunge_all()
 
     def annihilate(self):
         self.connection.close()
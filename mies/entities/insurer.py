@@ -1,6 +1,10 @@
 import numpy as np
-import os
+
+from functools import partial
+
 import pandas as pd
+import parameters as pm
+import patsy
 import statsmodels
 import statsmodels.api as sm
 import statsmodels.formula.api as smf
@@ -9,46 +13,256 @@ import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
 
 import mies.schema.insco as insco
-from mies.entities.bank import Bank
-from mies.schema.insco import Claim, ClaimTransaction, Customer, Policy
+from mies.entities.bank import BaseBank
+from mies.schema.insco import Policy
 from mies.schema.universe import Company
-from mies.utilities.connections import connect_company
-from mies.utilities.queries import query_customers_by_insurer_id
+from mies.utilities.connections import SqliteMixin, truncate_tables
 from mies.utilities.queries import query_open_case_reserves
-from mies.utilities.queries import query_accounts_by_person_id
 from mies.utilities.queries import query_pricing_model_data
 
 
-class Insurer:
+def fit_pricing_model(pricing_formula, book, var_power=1.5):
+    """
+    fit a tweedie glm with a log link to a book of policies and their incurred losses
+    """
+    return smf.glm(
+        formula=pricing_formula,
+        data=book,
+        family=sm.families.Tweedie(
+            link=statsmodels.genmod.families.links.log,
+            var_power=var_power
+        )).fit()
+
+
+def compile_rate_table(pricing_model):
+    """
+    premium of each risk cell under a fitted pricing model, or None when its formula
+    uses more than the rating factors and every quote has to go through predict
+    """
+    try:
+        rates = pricing_model.predict(pm.get_risk_cell_frame())
+    except (patsy.PatsyError, KeyError, NameError):
+        return None
+    return np.asarray(rates, dtype=float)
+
+
+def quote(pricing_model, rate_table, people):
+    """
+    premiums for people, looked up by risk cell in rate_table if there is one
+    """
+    if rate_table is None:
+        return np.asarray(pricing_model.predict(people), dtype=float)
+    return rate_table[pm.get_risk_cells(people)]
+
+
+class PricingQuoter:
+    """
+    a picklable copy of an insurer's pricing that can quote in a worker process. the
+    fitted model is refit from its book on unpickling, see BaseInsurer.__getstate__
+    """
+    def __init__(self, pricing_formula, pricing_book, pricing_var_power, pricing_model=None):
+        self.pricing_formula = pricing_formula
+        self.pricing_book = pricing_book
+        self.pricing_var_power = pricing_var_power
+        self.pricing_model = pricing_model
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pricing_model'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pricing_model = fit_pricing_model(self.pricing_formula, self.pricing_book, self.pricing_var_power)
+
+    def __call__(self, people):
+        return quote(self.pricing_model, None, people)
+
+
+def make_quoter(insurer):
+    """
+    a picklable callable returning the insurer's premiums for a frame of people, so that
+    quoting can run in a thread or process of its own. a rate table travels as it is
+    """
+    if insurer.rate_table is not None:
+        return partial(quote, None, insurer.rate_table)
+    return PricingQuoter(
+        insurer.pricing_formula,
+        insurer.pricing_book,
+        insurer.pricing_var_power,
+        insurer.pricing_model
+    )
+
+
+class BaseInsurer:
+    """
+    an insurance company, pricing its book with a glm and paying the claims reported to it
+    """
     def __init__(
         self,
         starting_capital,
-        bank: Bank,
+        bank: BaseBank,
         inception_date,
         company_name
     ):
-        if not os.path.exists('db/companies'):
-            os.makedirs('db/companies')
-        self.engine = sa.create_engine(
-            'sqlite:///db/companies/' + company_name + '.db',
-            echo=True
-        )
-        session = sessionmaker(bind=self.engine)
-        insco.Base.metadata.create_all(self.engine)
-        self.session = session()
-        self.connection = self.engine.connect()
+        self.company_name = company_name
         self.capital = starting_capital
+        self.starting_capital = starting_capital
+        self.inception_date = inception_date
         self.bank = bank
         self.cash_account = None
         self.liability_account = None
         self.capital_account = None
-        self.company_name = company_name
 
         self.pricing_model = None
-        self.id = self.__register()
+        self.rate_table = None
+        self.pricing_formula = None
+        self.pricing_var_power = None
+        self.pricing_book = None
+        self.id = self._register()
         self.__get_bank_account(inception_date)
 
-    def __register(self):
+    def __getstate__(self):
+        # fitted formula models do not survive pickling, so the pricing model
+        # is refit from the book it was last fit on, which is deterministic
+        state = self.__dict__.copy()
+        state['pricing_model'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.pricing_formula is not None:
+            self._fit_pricing_model()
+
+    def _register(self):
+        raise NotImplementedError
+
+    def _clear_book(self):
+        raise NotImplementedError
+
+    def _read_pricing_model_data(self):
+        raise NotImplementedError
+
+    def _read_open_case_reserves(self):
+        raise NotImplementedError
+
+    def _write_claim_transactions(self, claim_transactions):
+        raise NotImplementedError
+
+    def __get_bank_account(self, transaction_date):
+        self.bank.get_customers(self.id, 'insurer')
+        customer_id = self.bank.customers_by_type_id([self.id], 'insurer').iat[0]
+        self.cash_account = self.bank.assign_account(customer_id, 'cash')
+        self.liability_account = self.bank.assign_account(customer_id, 'liability')
+        self.capital_account = self.bank.assign_account(customer_id, 'capital')
+        self.bank.make_transaction(self.cash_account, self.liability_account, transaction_date, self.capital)
+
+    def reset(self):
+        """
+        clear the book, the claims and the pricing model, and fund the company with its
+        starting capital again. the bank's transactions are expected to be reset first
+        """
+        self._clear_book()
+        self.capital = self.starting_capital
+        self.pricing_model = None
+        self.rate_table = None
+        self.pricing_formula = None
+        self.pricing_var_power = None
+        self.pricing_book = None
+        self.bank.make_transaction(self.cash_account, self.liability_account, self.inception_date, self.capital)
+
+    def price_book(
+        self,
+        pricing_formula,
+        var_power=1.5
+    ):
+        self.pricing_formula = pricing_formula
+        self.pricing_var_power = var_power
+        self.pricing_book = self._read_pricing_model_data()
+
+        return self._fit_pricing_model()
+
+    def _fit_pricing_model(self):
+        self.pricing_model = fit_pricing_model(
+            self.pricing_formula,
+            self.pricing_book,
+            self.pricing_var_power
+        )
+        self.rate_table = compile_rate_table(self.pricing_model)
+
+        return self.pricing_model
+
+    def quote(self, people):
+        """
+        premium the company charges each of people under its current pricing model
+        """
+        return quote(self.pricing_model, self.rate_table, people)
+
+    def quoter(self):
+        return make_quoter(self)
+
+    def pay_claims(self, transaction_date):
+        case_reserves = self._read_open_case_reserves()
+
+        accounts_to_pay = self.bank.accounts_by_type_id(case_reserves['person_id'], 'person', 'cash')
+
+        case_reserves = case_reserves.merge(
+            accounts_to_pay,
+            on='person_id',
+            how='left'
+        )
+
+        # send checks to bank
+        payments = pd.DataFrame({
+            'debit_account': case_reserves['account_id'].values,
+            'credit_account': self.cash_account,
+            'transaction_date': transaction_date,
+            'transaction_amount': case_reserves['case reserve'].values
+        })
+
+        self.bank.make_transactions(payments.copy())
+
+        # people then use checks to pay their for their own losses
+
+        payments['credit_account'] = payments['debit_account']
+        payments['debit_account'] = self.bank.liability_account
+
+        self.bank.make_transactions(payments)
+
+        # reduce case reserves, pay and close each claim
+
+        claim_ids = case_reserves['claim_id'].values
+        amounts = case_reserves['case reserve'].values
+        self._write_claim_transactions(pd.DataFrame({
+            'claim_id': np.repeat(claim_ids, 3),
+            'transaction_date': transaction_date,
+            'transaction_type': np.tile(['reduce case reserve', 'claim payment', 'close claim'], len(claim_ids)),
+            'transaction_amount': np.column_stack([amounts, amounts, np.zeros(len(amounts))]).ravel()
+        }))
+
+
+class Insurer(SqliteMixin, BaseInsurer):
+    """
+    insurance company whose book is kept in sqlite, in db/companies/ + company_name + '.db'
+    """
+    schema = insco.Base
+
+    def __init__(
+        self,
+        starting_capital,
+        bank: BaseBank,
+        inception_date,
+        company_name
+    ):
+        self.company_name = company_name
+        self._connect()
+        super().__init__(starting_capital, bank, inception_date, company_name)
+
+    @property
+    def database_path(self):
+        return 'db/companies/' + self.company_name + '.db'
+
+    def _register(self):
         # populate universe company record
         insurer_table = pd.DataFrame([[self.capital, self.company_name]], columns=['capital', 'company_name'])
         universe_engine = sa.create_engine(
@@ -70,30 +284,23 @@ class Insurer:
         universe_connection.close()
         return self.id
 
-    def __get_bank_account(self, transaction_date):
-        self.bank.get_customers(self.id, 'insurer')
-        customer_id = query_customers_by_insurer_id([self.id], self.bank.name)
-        self.cash_account = self.bank.assign_account(customer_id, 'cash')
-        self.liability_account = self.bank.assign_account(customer_id, 'liability')
-        self.capital_account = self.bank.assign_account(customer_id, 'capital')
-        self.bank.make_transaction(self.cash_account, self.liability_account, transaction_date, self.capital)
+    def _clear_book(self):
+        truncate_tables(self.connection, ['claim_transaction', 'claim', 'policy', 'customer'])
+        self.session.expunge_all()
 
-    def price_book(
-        self,
-        pricing_formula
-    ):
+    def _read_pricing_model_data(self):
+        return query_pricing_model_data(self.company_name, self.connection)
 
-        book = query_pricing_model_data(self.company_name)
+    def _read_open_case_reserves(self):
+        return query_open_case_reserves(self.company_name, self.connection)
 
-        self.pricing_model = smf.glm(
-            formula=pricing_formula,
-            data=book,
-            family=sm.families.Tweedie(
-                link=statsmodels.genmod.families.links.log,
-                var_power=1.5
-            )).fit()
-
-        return self.pricing_model
+    def _write_claim_transactions(self, claim_transactions):
+        claim_transactions.to_sql(
+            'claim_transaction',
+            self.connection,
+            index=False,
+            if_exists='append'
+        )
 
     def get_book(
         self,
@@ -130,83 +337,11 @@ class Insurer:
             self,
             date
     ):
-        session, connection = connect_company(self.company_name)
-        in_force_query = session.query(Policy).filter(
+        in_force_query = self.session.query(Policy).filter(
                 date >= Policy.effective_date).filter(date <= Policy.expiration_date).statement
 
         in_force = pd.read_sql(
             in_force_query,
-            connection
+            self.connection
         )
-        connection.close()
         return in_force
-
-    def pay_claims(self, transaction_date):
-        # send checks to bank
-        case_reserves = query_open_case_reserves(self.company_name)
-
-        accounts_to_pay = query_accounts_by_person_id(
-            case_reserves['person_id'],
-            self.bank.name, 'cash'
-        )
-
-        case_reserves = case_reserves.merge(
-            accounts_to_pay,
-            on='person_id',
-            how='left'
-        )
-
-        case_reserves['transaction_date'] = transaction_date
-
-        case_reserves = case_reserves.rename(columns={
-            'case reserve': 'transaction_amount',
-            'account_id': 'debit_account'
-        })
-
-        case_reserves['credit_account'] = self.cash_account
-
-        payments = case_reserves[[
-            'debit_account',
-            'credit_account',
-            'transaction_date',
-            'transaction_amount']].copy()
-
-        self.bank.make_transactions(payments)
-
-        # people then use checks to pay their for their own losses
-
-        payments['credit_account'] = payments['debit_account']
-        payments['debit_account'] = self.bank.liability_account
-
-        self.bank.make_transactions(payments)
-
-
-        # reduce case reserves
-
-        objects = []
-
-        for index, row in case_reserves.iterrows():
-            reserve_takedown = ClaimTransaction(
-                claim_id = row['claim_id'],
-                transaction_date=row['transaction_date'],
-                transaction_type='reduce case reserve',
-                transaction_amount=row['transaction_amount']
-            )
-            claim_payment = ClaimTransaction(
-                claim_id=row['claim_id'],
-                transaction_date=row['transaction_date'],
-                transaction_type='claim payment',
-                transaction_amount=row['transaction_amount']
-            )
-            close_claim = ClaimTransaction(
-                claim_id=row['claim_id'],
-                transaction_date=row['transaction_date'],
-                transaction_type='close claim',
-                transaction_amount=0
-            )
-            objects.append(reserve_takedown)
-            objects.append(claim_payment)
-            objects.append(close_claim)
-
-        self.session.add_all(objects)
-        self.session.commit()
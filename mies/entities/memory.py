@@ -0,0 +1,530 @@
+# in-memory backend with the same entity api as the sqlite-backed entities.
+# every table of the schema is kept as pandas columns and nothing is written
+# to sqlite until God.persist is called, which is useful for parameter sweeps
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+import mies.schema.bank as bank_schema
+import mies.schema.insco as insco_schema
+import mies.schema.universe as universe_schema
+from mies.entities.bank import BaseBank
+from mies.entities.broker import BaseBroker
+from mies.entities.god import BaseGod
+from mies.entities.insurer import BaseInsurer
+from mies.parameters import RATING_FACTORS
+
+# contribution of each claim transaction type to incurred loss
+INCURRED_SIGNS = {
+    'claim payment': 1,
+    'set case reserve': 1,
+    'reduce case reserve': -1
+}
+
+# the universe created by the most recent God, shared by every entity created after it
+_universe = None
+
+
+class Table:
+    """
+    append-only column store for one table of the schema. primary keys are
+    assigned the way sqlite assigns them, counting up from 1
+    """
+    def __init__(self, columns, key=None):
+        self.key = key
+        self.columns = columns if key is None else [key] + columns
+        self.rows = 0
+        self.chunks = []
+        self._frame = None
+
+    def append(self, data):
+        data = data[[column for column in self.columns if column != self.key]].reset_index(drop=True)
+        if self.key is not None:
+            data.insert(0, self.key, np.arange(self.rows + 1, self.rows + len(data) + 1))
+        self.chunks.append(data)
+        self.rows += len(data)
+        self._frame = None
+        if self.key is not None:
+            return data[self.key]
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            if self.chunks:
+                self._frame = pd.concat(self.chunks, ignore_index=True)
+                self.chunks = [self._frame]
+            else:
+                # the empty frame has object columns, which would spread to the data appended after it
+                self._frame = pd.DataFrame(columns=self.columns)
+        return self._frame
+
+    def delete(self, where=None):
+        """
+        delete the rows where the boolean array where is true, or every row. like sqlite,
+        new keys count up from the largest key left
+        """
+        if where is None:
+            self.chunks = []
+            self.rows = 0
+        else:
+            frame = self.frame[~np.asarray(where)].reset_index(drop=True)
+            self.chunks = [frame] if self.chunks else []
+            if self.key is None or frame.empty:
+                self.rows = len(frame)
+            else:
+                self.rows = int(frame[self.key].max())
+        self._frame = None
+
+    def update(self, data, key=None):
+        """
+        overwrite the other columns of data in the rows whose keys are in its key column. key
+        names the column to match rows on instead, one unique to each row, for a table without primary key
+        """
+        key = key or self.key
+        frame = self.frame
+        rows = pd.Index(frame[key]).get_indexer(data[key])
+        for column in data.columns.drop(key):
+            frame.iloc[rows, frame.columns.get_loc(column)] = data[column].values
+
+    def to_sql(self, name, connection):
+        self.frame.to_sql(
+            name,
+            connection,
+            index=False,
+            if_exists='append'
+        )
+
+
+class Universe:
+    """
+    the universe tables, along with every bank and insurer registered in it
+    """
+    def __init__(self):
+        self.person = Table([
+            'age_class',
+            'profession',
+            'health_status',
+            'education_level',
+            'risk_cell',
+            'income',
+            'cobb_c',
+            'cobb_d',
+            'exit_date'
+        ], key='person_id')
+        self.company = Table(['company_name', 'capital'], key='company_id')
+        self.bank = Table(['bank_name'], key='bank_id')
+        self.event = Table([
+            'event_date',
+            'report_date',
+            'event_day',
+            'report_day',
+            'person_id',
+            'ground_up_loss'
+        ], key='event_id')
+        self.banks = {}
+        self.insurers = {}
+
+    def living(self):
+        """
+        the people who have not left the population
+        """
+        people = self.person.frame
+        return people[people['exit_date'].isnull()]
+
+
+def _current_universe():
+    if _universe is None:
+        raise RuntimeError('no universe exists yet, create a God first')
+    return _universe
+
+
+def query_population(connection=None):
+    """
+    return the person table of the current universe, without the people who have left.
+    connection is accepted for parity with the sqlite queries and ignored
+    """
+    return _current_universe().living().copy()
+
+
+def query_customers_by_person_id(person_ids, bank_name, connection=None):
+    """
+    get corresponding customer ids for each person id in a list of person ids
+    """
+    return _current_universe().banks[bank_name].customers_by_type_id(person_ids, 'person')
+
+
+def query_accounts_by_person_id(person_ids, bank_name, account_type, connection=None):
+    """
+    get all the accounts for each person id in a list of person ids
+    """
+    return _current_universe().banks[bank_name].accounts_by_type_id(person_ids, 'person', account_type)
+
+
+def query_accounts_by_company_id(insurer_ids, bank_name, account_type, connection=None):
+    """
+    get all bank accounts for each insurer in a list of insurer ids
+    """
+    return _current_universe().banks[bank_name].accounts_by_type_id(insurer_ids, 'insurer', account_type)
+
+
+class God(BaseGod):
+    """
+    god of a universe kept in memory
+    """
+    def __init__(self, *args, **kwargs):
+        global _universe
+        self.universe = Universe()
+        _universe = self.universe
+        # there is no database to hold a transaction on, see mies.utilities.connections.unit_of_work
+        self.connection = None
+        super().__init__(*args, **kwargs)
+
+    def __setstate__(self, state):
+        # an unpickled god brings its universe back with it
+        global _universe
+        self.__dict__.update(state)
+        _universe = self.universe
+
+    def _write_people(self, population):
+        self.universe.person.append(population)
+
+    def _update_people(self, updates):
+        self.universe.person.update(updates)
+
+    def _exit_people(self, person_ids, exit_date):
+        self.universe.person.update(pd.DataFrame({'person_id': person_ids, 'exit_date': exit_date}))
+
+    def _read_exposure(self):
+        return self.universe.living()[['person_id', 'risk_cell']].reset_index(drop=True)
+
+    def _read_person_state(self):
+        return self.universe.living()[['person_id', 'risk_cell', 'income']].reset_index(drop=True)
+
+    def _read_incomes(self, person_ids):
+        people = self.universe.living()
+        return people[people['person_id'].isin(person_ids)][['person_id', 'income']]
+
+    def _write_events(self, events):
+        self.universe.event.append(events)
+
+    def _clear(self, keep_population):
+        self.universe.event.delete()
+        if not keep_population:
+            self.universe.person.delete()
+
+    def persist(self, db_path='db'):
+        """
+        write the universe, every bank and every insurer out in the sqlite schema,
+        one transaction per database
+        """
+        if not os.path.exists(os.path.join(db_path, 'companies')):
+            os.makedirs(os.path.join(db_path, 'companies'))
+        if not os.path.exists(os.path.join(db_path, 'banks')):
+            os.makedirs(os.path.join(db_path, 'banks'))
+
+        _write_database(
+            os.path.join(db_path, 'universe.db'),
+            universe_schema.Base,
+            {
+                'person': self.universe.person,
+                'company': self.universe.company,
+                'bank': self.universe.bank,
+                'event': self.universe.event
+            }
+        )
+
+        for bank in self.universe.banks.values():
+            _write_database(
+                os.path.join(db_path, 'banks', bank.name + '.db'),
+                bank_schema.Base,
+                {
+                    'customer': bank.customer,
+                    'person': bank.customer_types['person'],
+                    'insurer': bank.customer_types['insurer'],
+                    'bank': bank.customer_types['bank'],
+                    'account': bank.account,
+                    'transaction': bank.transaction
+                }
+            )
+
+        for insurer in self.universe.insurers.values():
+            _write_database(
+                os.path.join(db_path, 'companies', insurer.company_name + '.db'),
+                insco_schema.Base,
+                {
+                    'customer': insurer.customer,
+                    'policy': insurer.policy,
+                    'claim': insurer.claim,
+                    'claim_transaction': insurer.claim_transaction
+                }
+            )
+
+    def annihilate(self):
+        global _universe
+        if _universe is self.universe:
+            _universe = None
+        self.universe = Universe()
+
+
+def _write_database(path, base, tables):
+    engine = sa.create_engine('sqlite:///' + path)
+    base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for name, table in tables.items():
+            table.to_sql(name, connection)
+    engine.dispose()
+
+
+class Bank(BaseBank):
+    """
+    bank whose books are kept in memory
+    """
+    def __init__(self, starting_capital, bank_name, path='db/banks/', date_established=dt.datetime(1, 12, 31)):
+        self.universe = _current_universe()
+        self.connection = None
+
+        self.customer = Table(['customer_type'], key='customer_id')
+        self.customer_types = {
+            customer_type: Table(['customer_id', customer_type + '_id'])
+            for customer_type in ['person', 'insurer', 'bank']
+        }
+        self.account = Table(['customer_id', 'account_type'], key='account_id')
+        self.transaction = Table([
+            'debit_account',
+            'credit_account',
+            'transaction_date',
+            'transaction_amount'
+        ], key='transaction_id')
+
+        self.name = bank_name
+        super().__init__(starting_capital, bank_name, date_established)
+
+    def _register(self):
+        bank_id = self.universe.bank.append(pd.DataFrame({'bank_name': [self.name]})).iat[0]
+        self.universe.banks[self.name] = self
+        return bank_id
+
+    def get_customers(self, ids, customer_type):
+        ids = pd.Series(ids).reset_index(drop=True)
+        customer_ids = self.customer.append(pd.DataFrame({'customer_type': customer_type}, index=ids.index))
+        self.customer_types[customer_type].append(pd.DataFrame({
+            'customer_id': customer_ids,
+            customer_type + '_id': ids
+        }))
+
+    def customers_by_type_id(self, ids, customer_type):
+        customers = self.customer_types[customer_type].frame
+        return customers[customers[customer_type + '_id'].isin(ids)]['customer_id']
+
+    def accounts_by_type_id(self, ids, customer_type, account_type):
+        """
+        returns the type id, customer id and account id of each account of account_type
+        held by the customers of customer_type with the given ids
+        """
+        customers = self.customer_types[customer_type].frame
+        customers = customers[customers[customer_type + '_id'].isin(ids)]
+        accounts = self.account.frame
+        accounts = accounts[accounts['account_type'] == account_type]
+        accounts = customers.merge(accounts, on='customer_id', how='inner')
+        return accounts[[customer_type + '_id', 'customer_id', 'account_id']]
+
+    def _write_accounts(self, customer_ids, account_type):
+        customer_ids = pd.Series(customer_ids).reset_index(drop=True)
+        self.account.append(pd.DataFrame({
+            'customer_id': customer_ids,
+            'account_type': account_type
+        }))
+
+    def _write_account(self, customer_id, account_type):
+        return self.account.append(pd.DataFrame({
+            'customer_id': [customer_id],
+            'account_type': [account_type]
+        })).iat[0]
+
+    def _remove_people(self):
+        people = self.customer.frame['customer_type'] == 'person'
+        person_customers = self.customer.frame['customer_id'][people]
+        self.account.delete(self.account.frame['customer_id'].isin(person_customers).values)
+        self.customer.delete(people.values)
+        self.customer_types['person'].delete()
+
+    def _clear_transactions(self):
+        self.transaction.delete()
+
+    def make_transaction(self, debit_account, credit_account, transaction_date, transaction_amount):
+        """
+        make a single transaction
+        """
+        return self.transaction.append(pd.DataFrame({
+            'debit_account': [int(debit_account)],
+            'credit_account': [int(credit_account)],
+            'transaction_date': [transaction_date],
+            'transaction_amount': [transaction_amount]
+        })).iat[0]
+
+    def _write_transactions(self, data):
+        self.transaction.append(data)
+
+
+class Insurer(BaseInsurer):
+    """
+    insurance company whose book is kept in memory
+    """
+    def __init__(
+        self,
+        starting_capital,
+        bank: Bank,
+        inception_date,
+        company_name
+    ):
+        self.universe = _current_universe()
+        self.connection = None
+
+        self.customer = Table(['person_id'] + RATING_FACTORS + ['risk_cell'])
+        self.policy = Table([
+            'person_id',
+            'effective_date',
+            'expiration_date',
+            'premium'
+        ] + RATING_FACTORS + ['risk_cell'], key='policy_id')
+        self.claim = Table([
+            'policy_id',
+            'person_id',
+            'event_id',
+            'occurrence_date',
+            'report_date'
+        ], key='claim_id')
+        self.claim_transaction = Table([
+            'claim_id',
+            'transaction_date',
+            'transaction_type',
+            'transaction_amount'
+        ], key='claim_transaction_id')
+
+        super().__init__(starting_capital, bank, inception_date, company_name)
+
+    def _register(self):
+        company_id = self.universe.company.append(pd.DataFrame({
+            'company_name': [self.company_name],
+            'capital': [self.capital]
+        })).iat[0]
+        self.universe.insurers[self.company_name] = self
+        return company_id
+
+    def _clear_book(self):
+        for table in [self.customer, self.policy, self.claim, self.claim_transaction]:
+            table.delete()
+
+    def _read_pricing_model_data(self):
+        """
+        each policy with the rating factors it was placed with and its incurred loss
+        """
+        transactions = self.claim_transaction.frame
+        signs = transactions['transaction_type'].map(INCURRED_SIGNS).fillna(0)
+        incurred = (transactions['transaction_amount'] * signs).groupby(transactions['claim_id']).sum()
+        claims = self.claim.frame[['claim_id', 'policy_id']]
+        claims = claims.merge(incurred.rename('incurred_loss'), left_on='claim_id', right_index=True, how='left')
+        incurred = claims.groupby('policy_id')['incurred_loss'].sum()
+
+        book = self.policy.frame[['policy_id', 'person_id'] + RATING_FACTORS + ['risk_cell']]
+        book = book.merge(incurred, left_on='policy_id', right_index=True, how='left')
+        book['incurred_loss'] = book['incurred_loss'].fillna(0).astype(float)
+        return book
+
+    def in_force(
+            self,
+            date
+    ):
+        policies = self.policy.frame
+        return policies[(policies['effective_date'] <= date) & (policies['expiration_date'] >= date)]
+
+    def _read_open_case_reserves(self):
+        """
+        case reserve outstanding on each open claim along with the claimant
+        """
+        transactions = self.claim_transaction.frame
+        closed = transactions[transactions['transaction_type'] == 'close claim']['claim_id']
+        reserves = transactions[
+            (transactions['transaction_type'] == 'set case reserve') &
+            ~transactions['claim_id'].isin(closed)
+        ]
+        reserves = reserves.groupby('claim_id')['transaction_amount'].sum().rename('case reserve').reset_index()
+        return reserves.merge(self.claim.frame[['claim_id', 'person_id']], on='claim_id', how='left')
+
+    def _write_claim_transactions(self, claim_transactions):
+        self.claim_transaction.append(claim_transactions)
+
+
+class Broker(BaseBroker):
+    """
+    broker for a universe kept in memory, the one of the most recent God
+    """
+    def __init__(self, *args, **kwargs):
+        self.universe = _current_universe()
+        super().__init__(*args, **kwargs)
+
+    def all_policies(self, start_date=None, end_date=None):
+        """
+        every policy of every insurer, or those in force at any time from start_date through end_date
+        """
+        policies = [pd.DataFrame(columns=['policy_id', 'person_id', 'effective_date', 'expiration_date', 'premium'])]
+        for insurer in self.universe.insurers.values():
+            policy = insurer.policy.frame
+            if start_date is not None:
+                policy = policy[(policy['effective_date'] <= end_date) & (policy['expiration_date'] >= start_date)]
+            policy = policy.copy()
+            policy['company_id'] = insurer.id
+            policy['company_name'] = insurer.company_name
+            policies.append(policy)
+        return pd.concat(policies, ignore_index=True)
+
+    def identify_free_business(
+            self,
+            curr_date,
+            connection=None,
+            company_connections=None
+    ):
+        # expiring policies and people with no policy, with their attributes
+        policies = self.all_policies()
+        expiring = policies[policies['expiration_date'] == curr_date][[
+            'policy_id', 'person_id', 'effective_date', 'expiration_date', 'premium', 'company_id'
+        ]]
+        expiring = expiring.rename(columns={'company_id': 'incumbent_id'}).astype({'person_id': int})
+        return self.universe.living().merge(expiring, on='person_id', how='left')
+
+    def _read_companies(self, connection):
+        return self.universe.company.frame
+
+    def _read_reported_events(self, start_day, end_day, connection):
+        events = self.universe.event.frame
+        report_day = events['report_day'].values
+        return events[(report_day >= start_day) & (report_day <= end_day)]
+
+    def _read_policies_between(self, start_date, end_date, connection, company_connections):
+        return self.all_policies(start_date, end_date)
+
+    def _write_placements(self, company_name, new_business, company_connections):
+        insurer = self.universe.insurers[company_name]
+        insurer.policy.append(new_business)
+
+        # existing customers are given the attributes they are placed with
+        existing = new_business['person_id'].isin(insurer.customer.frame['person_id'])
+        insurer.customer.update(new_business.loc[existing, insurer.customer.columns], key='person_id')
+        insurer.customer.append(new_business[~existing])
+
+    def _write_claims(self, company_name, reported_claims, company_connections):
+        insurer = self.universe.insurers[company_name]
+        claim_ids = insurer.claim.append(reported_claims)
+
+        insurer.claim_transaction.append(pd.DataFrame({
+            'claim_id': np.repeat(claim_ids.values, 2),
+            'transaction_date': np.repeat(reported_claims['report_date'].values, 2),
+            'transaction_type': np.tile(['open claim', 'set case reserve'], len(claim_ids)),
+            'transaction_amount': np.column_stack([
+                np.zeros(len(claim_ids)),
+                reported_claims['ground_up_loss'].values
+            ]).ravel()
+        }))
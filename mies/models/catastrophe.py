@@ -0,0 +1,87 @@
+# common shocks for God.smite. a peril strikes a whole period with some probability and
+# loads the frequency and severity of the people in the risk cells it affects, so that
+# their losses are correlated. loadings are kept as n_periods x parameters.N_CELLS tables
+# and reach each person by indexing with risk cells, as the loss models do
+import numpy as np
+import pandas as pd
+import parameters as pm
+
+
+class Peril:
+    """
+    a shock that strikes a period with the given probability, multiplying the frequency
+    and severity of everyone in the risk cells selected by affected, a dict of rating
+    factor to the levels affected, such as {'profession': ['B']}. every cell is affected
+    when affected is empty
+    """
+    def __init__(self, name, probability, affected=None, frequency_loading=1, severity_loading=1):
+        self.name = name
+        self.probability = probability
+        self.affected = affected or {}
+        self.frequency_loading = frequency_loading
+        self.severity_loading = severity_loading
+        self.cells = self.cell_mask()
+
+    def cell_mask(self):
+        """
+        boolean array of the risk cells the peril affects
+        """
+        cells = pm.get_risk_cell_frame()
+        mask = np.ones(pm.N_CELLS, dtype=bool)
+        for factor, levels in self.affected.items():
+            unknown = set(levels) - set(pm.person_params[factor])
+            if unknown:
+                raise ValueError('unknown levels of %s: %s' % (factor, sorted(unknown)))
+            mask &= cells[factor].isin(levels).values
+        return mask
+
+
+class CatastropheModel:
+    """
+    a set of perils, each drawn independently every period
+    """
+    def __init__(self, perils):
+        self.perils = [peril if isinstance(peril, Peril) else Peril(**peril) for peril in perils]
+        self.cells = np.array([peril.cells for peril in self.perils]).reshape(len(self.perils), pm.N_CELLS)
+        self.frequency_loadings = np.array([peril.frequency_loading for peril in self.perils], dtype=float)
+        self.severity_loadings = np.array([peril.severity_loading for peril in self.perils], dtype=float)
+
+    def sample(self, n_periods, rng):
+        """
+        draw which perils strike each of n_periods periods. returns an n_periods x n_perils
+        boolean array of strikes and the n_periods x N_CELLS frequency and severity loadings
+        they add up to, loadings of perils that strike together being multiplied
+        """
+        probabilities = np.array([peril.probability for peril in self.perils], dtype=float)
+        strikes = rng.random((n_periods, len(self.perils))) < probabilities
+        return strikes, self.loadings(strikes, self.frequency_loadings), self.loadings(strikes, self.severity_loadings)
+
+    def loadings(self, strikes, peril_loadings):
+        # product over perils of the peril's loading in the cells it strikes, 1 elsewhere
+        factors = np.where(self.cells, peril_loadings[:, None], 1.)
+        loadings = np.ones((len(strikes), pm.N_CELLS))
+        for i, peril_factors in enumerate(factors):
+            loadings[strikes[:, i]] *= peril_factors
+        return loadings
+
+    def strike_frame(self, strikes, event_dates):
+        """
+        one row per peril that strikes, with the date of its period
+        """
+        period, peril_index = np.nonzero(strikes)
+        return pd.DataFrame({
+            'event_date': np.array(event_dates, dtype=object)[period],
+            'peril': np.array([peril.name for peril in self.perils], dtype=object)[peril_index]
+        })
+
+
+def build_catastrophe_model(config):
+    """
+    instantiate a list of peril configurations such as parameters.catastrophes, each
+    a dict of Peril arguments. returns None when there are no perils
+    """
+    if isinstance(config, CatastropheModel):
+        return config
+    if not config:
+        return None
+    return CatastropheModel(config)
@@ -0,0 +1,135 @@
+# vectorized transitions of the population between periods, applied by God.evolve.
+# each transition steps a state of numpy arrays with one entry per living person: person_id,
+# the integer code of each rating factor (see parameters.RATING_FACTORS) and income
+import numpy as np
+import pandas as pd
+import parameters as pm
+
+
+class Markov:
+    """
+    move a categorical attribute between its levels, such as aging from one age class to the next
+    or health transitions. transitions has a row for each current level and a column for each next level
+    """
+    def __init__(self, attribute, transitions):
+        self.attribute = attribute
+        transitions = np.asarray(transitions, dtype=float)
+        self.cdf = np.cumsum(transitions / transitions.sum(axis=1, keepdims=True), axis=1)
+
+    def step(self, state, rng):
+        codes = state[self.attribute]
+        cdf = self.cdf[codes]
+        new_codes = (rng.random(len(codes))[:, np.newaxis] >= cdf[:, :-1]).sum(axis=1)
+        return {self.attribute: new_codes.astype(codes.dtype)}
+
+
+class Growth:
+    """
+    grow a numeric attribute such as income by rate each period, with lognormal noise of
+    log standard deviation sigma around it
+    """
+    def __init__(self, attribute='income', rate=.02, sigma=0):
+        self.attribute = attribute
+        self.rate = rate
+        self.sigma = sigma
+
+    def step(self, state, rng):
+        growth = np.full(len(state[self.attribute]), 1 + self.rate)
+        if self.sigma:
+            growth *= rng.lognormal(-self.sigma ** 2 / 2, self.sigma, size=len(growth))
+        return {self.attribute: state[self.attribute] * growth}
+
+
+class Exit:
+    """
+    remove people from the population with the given probability, or with a probability
+    for each level of the rating factor given
+    """
+    def __init__(self, probability, given=None):
+        self.probability = np.asarray(probability, dtype=float)
+        self.given = given
+
+    def step(self, state, rng):
+        probability = self.probability if self.given is None else self.probability[state[self.given]]
+        return {'exit': rng.random(len(state['person_id'])) < probability}
+
+
+class Entry:
+    """
+    add new people, drawn with the population samplers, at a poisson rate
+    proportional to the size of the population
+    """
+    def __init__(self, rate):
+        self.rate = rate
+
+    def step(self, state, rng):
+        return {'entrants': int(rng.poisson(self.rate * len(state['person_id'])))}
+
+
+TRANSITIONS = {
+    'markov': Markov,
+    'growth': Growth,
+    'exit': Exit,
+    'entry': Entry
+}
+
+
+def register_transition(name, transition):
+    """
+    make a transition available under name. a transition has a step(state, rng) method
+    returning a dict of the attributes it changes to their new arrays. the key exit flags
+    people leaving the population, and the key entrants the number of people joining it
+    """
+    TRANSITIONS[name] = transition
+
+
+def build_transitions(config):
+    """
+    instantiate a list of (transition name, keyword arguments) pairs such as
+    parameters.population_dynamics. transition objects are kept as they are
+    """
+    return [
+        TRANSITIONS[entry[0]](**entry[1]) if isinstance(entry, tuple) else entry
+        for entry in config
+    ]
+
+
+def step_population(people, transitions, rng):
+    """
+    run the transitions on people, a frame of person_id, risk_cell and income of the living
+    population. returns the rows that changed, with the new values of the columns that
+    changed and a recoded risk cell, the ids of the people leaving, and the number joining
+    """
+    codes = pm.decode_risk_cells(people['risk_cell'].values)
+    before = {'person_id': people['person_id'].values, 'income': people['income'].values}
+    for factor, code in zip(pm.RATING_FACTORS, codes):
+        before[factor] = code
+
+    state = dict(before)
+    leaving = np.zeros(len(people), dtype=bool)
+    n_entrants = 0
+    for transition in transitions:
+        updates = transition.step(state, rng)
+        leaving |= updates.pop('exit', False)
+        n_entrants += updates.pop('entrants', 0)
+        state.update(updates)
+
+    changed_columns = [
+        column for column in pm.RATING_FACTORS + ['income']
+        if state[column] is not before[column]
+    ]
+    changed = np.zeros(len(people), dtype=bool)
+    for column in changed_columns:
+        changed |= state[column] != before[column]
+    changed &= ~leaving
+
+    updates = pd.DataFrame({'person_id': before['person_id'][changed]})
+    factors = [factor for factor in pm.RATING_FACTORS if factor in changed_columns]
+    for factor in factors:
+        updates[factor] = pm.decode_levels(state[factor][changed], factor)
+    if factors:
+        updates['risk_cell'] = pm.encode_risk_cells([state[factor][changed] for factor in pm.RATING_FACTORS])
+    if 'income' in changed_columns:
+        updates['income'] = state['income'][changed]
+
+    return updates, before['person_id'][leaving], n_entrants
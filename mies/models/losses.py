@@ -0,0 +1,231 @@
+# frequency, severity and reporting lag models for God.smite. each frequency and
+# severity model precomputes its parameters for every risk cell (see parameters.N_CELLS)
+# and samples a whole batch of people or losses at once by indexing those tables with risk cells.
+# frequency models also take an optional n_periods x N_CELLS table of multiplicative loadings
+# on their means, see mies.models.catastrophe
+import numpy as np
+import parameters as pm
+
+
+def default_lambdas():
+    """
+    poisson mean of each risk cell, the sum of the frequency parameter of each rating factor
+    """
+    return pm.compile_cell_table(pm.lambda_params)
+
+
+def default_scales():
+    """
+    gamma scale of each risk cell, the sum of the severity parameter of each rating factor
+    """
+    return pm.compile_cell_table(pm.scale_params)
+
+
+def default_severity_means():
+    # mean of the default gamma severity with shape 2
+    return 2 * default_scales()
+
+
+def load(table, loadings):
+    # the per cell table, or one per period multiplied by the loadings
+    return table if loadings is None else table * loadings
+
+
+class Poisson:
+    def __init__(self, lambdas=None):
+        self.lambdas = default_lambdas() if lambdas is None else np.asarray(lambdas, dtype=float)
+
+    def sample(self, cells, n_periods, rng, loadings=None):
+        """
+        n_periods x len(cells) matrix of event counts
+        """
+        return rng.poisson(load(self.lambdas, loadings)[..., cells], size=(n_periods, len(cells)))
+
+
+class NegativeBinomial:
+    """
+    negative binomial with the poisson means of each cell and dispersion k, so the
+    variance of a cell with mean m is m + m ** 2 / k
+    """
+    def __init__(self, k=1, means=None):
+        self.k = k
+        self.means = default_lambdas() if means is None else np.asarray(means, dtype=float)
+        self.p = k / (k + self.means)
+
+    def sample(self, cells, n_periods, rng, loadings=None):
+        p = self.p if loadings is None else self.k / (self.k + load(self.means, loadings))
+        return rng.negative_binomial(self.k, p[..., cells], size=(n_periods, len(cells)))
+
+
+class ZeroInflatedPoisson:
+    """
+    poisson counts that are zeroed with probability zero_probability, with the poisson
+    means of each cell scaled up by 1 / (1 - zero_probability) so that the counts keep
+    the given means, as NegativeBinomial does, and only their dispersion grows
+    """
+    def __init__(self, zero_probability=.5, means=None):
+        if not 0 <= zero_probability < 1:
+            raise ValueError('zero_probability must lie in [0, 1)')
+        self.zero_probability = zero_probability
+        self.means = default_lambdas() if means is None else np.asarray(means, dtype=float)
+        self.lambdas = self.means / (1 - zero_probability)
+
+    def sample(self, cells, n_periods, rng, loadings=None):
+        counts = rng.poisson(load(self.lambdas, loadings)[..., cells], size=(n_periods, len(cells)))
+        counts[rng.random(counts.shape) < self.zero_probability] = 0
+        return counts
+
+
+class Gamma:
+    def __init__(self, shape=2, scales=None):
+        self.shape = shape
+        self.scales = default_scales() if scales is None else np.asarray(scales, dtype=float)
+
+    def sample(self, cells, rng):
+        """
+        one ground up loss for each entry of cells
+        """
+        return rng.gamma(self.shape, self.scales[cells])
+
+
+class Lognormal:
+    """
+    lognormal with log standard deviation sigma and the given mean in each cell
+    """
+    def __init__(self, sigma=1, means=None):
+        self.sigma = sigma
+        means = default_severity_means() if means is None else np.asarray(means, dtype=float)
+        self.mus = np.log(means) - sigma ** 2 / 2
+
+    def sample(self, cells, rng):
+        return rng.lognormal(self.mus[cells], self.sigma)
+
+
+class Pareto:
+    """
+    pareto with tail index alpha > 1 and the given mean in each cell
+    """
+    def __init__(self, alpha=3, means=None):
+        self.alpha = alpha
+        means = default_severity_means() if means is None else np.asarray(means, dtype=float)
+        self.scales = means * (alpha - 1) / alpha
+
+    def sample(self, cells, rng):
+        return self.scales[cells] * (1 + rng.pareto(self.alpha, size=len(cells)))
+
+
+class Mixture:
+    """
+    each loss is drawn from one of components, a list of severity model configurations,
+    chosen with the given weights
+    """
+    def __init__(self, components, weights):
+        self.components = [build_severity_model(component) for component in components]
+        self.weights = np.asarray(weights, dtype=float) / np.sum(weights)
+
+    def sample(self, cells, rng):
+        component = rng.choice(len(self.components), size=len(cells), p=self.weights)
+        losses = np.empty(len(cells))
+        for i, model in enumerate(self.components):
+            chosen = component == i
+            losses[chosen] = model.sample(cells[chosen], rng)
+        return losses
+
+
+class Immediate:
+    """
+    every event is reported on the day it occurs
+    """
+    def sample(self, size, rng):
+        return np.zeros(size, dtype=np.int64)
+
+
+class Geometric:
+    """
+    reporting delay in whole days, geometric with the given mean
+    """
+    def __init__(self, mean_days=30):
+        self.mean_days = mean_days
+
+    def sample(self, size, rng):
+        return rng.geometric(1 / (1 + self.mean_days), size=size) - 1
+
+
+FREQUENCY_MODELS = {
+    'poisson': Poisson,
+    'negative_binomial': NegativeBinomial,
+    'zero_inflated_poisson': ZeroInflatedPoisson
+}
+
+SEVERITY_MODELS = {
+    'gamma': Gamma,
+    'lognormal': Lognormal,
+    'pareto': Pareto,
+    'mixture': Mixture
+}
+
+LAG_MODELS = {
+    'immediate': Immediate,
+    'geometric': Geometric
+}
+
+
+def register_frequency_model(name, model):
+    """
+    make a frequency model available under name. a frequency model has a
+    sample(cells, n_periods, rng, loadings=None) method returning an n_periods x len(cells)
+    count matrix, with means multiplied by the n_periods x N_CELLS loadings if given
+    """
+    FREQUENCY_MODELS[name] = model
+
+
+def register_severity_model(name, model):
+    """
+    make a severity model available under name. a severity model has a
+    sample(cells, rng) method returning one loss per cell
+    """
+    SEVERITY_MODELS[name] = model
+
+
+def register_lag_model(name, model):
+    """
+    make a reporting lag model available under name. a lag model has a
+    sample(size, rng) method returning a delay in days for each of size events
+    """
+    LAG_MODELS[name] = model
+
+
+def _build(models, config):
+    # a (model name, keyword arguments) pair, or a dict of keyword arguments with the model
+    # name under 'name'. model objects are returned as they are
+    if isinstance(config, tuple):
+        name, kwargs = config
+        return models[name](**kwargs)
+    if isinstance(config, dict):
+        kwargs = dict(config)
+        return models[kwargs.pop('name')](**kwargs)
+    return config
+
+
+def build_frequency_model(config):
+    """
+    instantiate a frequency model configuration such as parameters.frequency_model,
+    or {'name': 'negative_binomial', 'k': 1}
+    """
+    return _build(FREQUENCY_MODELS, config)
+
+
+def build_severity_model(config):
+    """
+    instantiate a severity model configuration such as parameters.severity_model,
+    or {'name': 'lognormal', 'sigma': 1}
+    """
+    return _build(SEVERITY_MODELS, config)
+
+
+def build_lag_model(config):
+    """
+    instantiate a reporting lag configuration such as parameters.report_lag,
+    or {'name': 'geometric', 'mean_days': 30}
+    """
+    return _build(LAG_MODELS, config)
@@ -0,0 +1,98 @@
+# how the broker turns insurers' quotes into placements. quotes are kept as an N x K
+# matrix, one row per person and one column per insurer, and winners are mapped back
+# to company ids through an index array rather than through column names
+import numpy as np
+
+from mies.econtools.utility import cobb_douglas_demand
+
+
+def quote_matrix(free_business, insurers, executor=None):
+    """
+    N x K matrix of each insurer's quote for each row of free_business. given an executor,
+    such as a ThreadPoolExecutor or ProcessPoolExecutor, every insurer quotes concurrently
+    in a worker of its own through the picklable callable returned by Insurer.quoter
+    """
+    quotes = np.empty((len(free_business), len(insurers)))
+    if executor is None:
+        for k, insurer in enumerate(insurers):
+            quotes[:, k] = insurer.quote(free_business)
+        return quotes
+
+    futures = [executor.submit(insurer.quoter(), free_business) for insurer in insurers]
+    for k, future in enumerate(futures):
+        quotes[:, k] = future.result()
+    return quotes
+
+
+def select_quotes(quotes, company_ids, tie_break='random', rng=None):
+    """
+    lowest quote in each row of quotes and the id of the company that made it, company_ids
+    giving the id of each column. ties go to a random one of the tied companies, drawn with
+    the numpy Generator rng or a fresh one, or to the first with tie_break='first'. rows
+    without any finite quote are given a nan premium and company id -1
+    """
+    quotes = np.where(np.isfinite(quotes), quotes, np.inf)
+    best = quotes.min(axis=1)
+    if tie_break == 'first':
+        winners = quotes.argmin(axis=1)
+    elif tie_break == 'random':
+        rng = np.random.default_rng() if rng is None else rng
+        tied = quotes == best[:, np.newaxis]
+        winners = np.where(tied, rng.random(quotes.shape), -1).argmax(axis=1)
+    else:
+        raise ValueError('unknown tie_break: %s' % tie_break)
+
+    quoted = np.isfinite(best)
+    premiums = np.where(quoted, best, np.nan)
+    winning_ids = np.where(quoted, np.asarray(company_ids)[winners], -1)
+    return premiums, winning_ids
+
+
+def logit_choice(quotes, company_ids, incumbent_ids=None, price_sensitivity=10., loyalty=0., rng=None):
+    """
+    an insurer for each row of quotes drawn with multinomial logit probabilities, in one softmax
+    over the whole matrix and one uniform draw per row. a quote's utility falls by price_sensitivity
+    for each unit of its premium in excess of the lowest in its row, relative to that lowest premium,
+    and rises by loyalty when its company is the row's incumbent, incumbent_ids giving the company
+    id of each row's expiring policy. the draws are made with the numpy Generator rng or a fresh
+    one. returns premiums and company ids as select_quotes does
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    quotes = np.asarray(quotes, dtype=float)
+    company_ids = np.asarray(company_ids)
+    quoted = np.isfinite(quotes)
+    best = np.where(quoted, quotes, np.inf).min(axis=1)
+    has_quote = np.isfinite(best)
+
+    best = np.where(has_quote, best, 1.)[:, np.newaxis]
+    utility = np.where(quoted, -price_sensitivity * (quotes / best - 1), -np.inf)
+    if incumbent_ids is not None and loyalty:
+        incumbent_ids = np.asarray(incumbent_ids, dtype=float)
+        utility += loyalty * (company_ids[np.newaxis, :] == incumbent_ids[:, np.newaxis])
+    utility[~has_quote] = 0
+
+    weights = np.exp(utility - utility.max(axis=1, keepdims=True))
+    cdf = np.cumsum(weights, axis=1)
+    cdf /= cdf[:, -1:]
+    winners = (rng.random(len(quotes))[:, np.newaxis] >= cdf[:, :-1]).sum(axis=1)
+
+    premiums = np.where(has_quote, quotes[np.arange(len(quotes)), winners], np.nan)
+    winning_ids = np.where(has_quote, company_ids[winners], -1)
+    return premiums, winning_ids
+
+
+def take_up(free_business, premiums, threshold=1.):
+    """
+    whether each person in free_business buys a policy at the premium offered: a Cobb-Douglas
+    consumer with their income and cobb_c and cobb_d parameters buys when the quantity of
+    insurance they demand at that premium, cobb_c / (cobb_c + cobb_d) of their income over
+    the premium, amounts to at least threshold policies. the default of one policy has people
+    buy when the share of their income they would spend on insurance covers the premium
+    """
+    quantities = cobb_douglas_demand(
+        free_business['income'].values,
+        premiums,
+        free_business['cobb_c'].values,
+        free_business['cobb_d'].values
+    )[0]
+    return quantities >= threshold
@@ -0,0 +1,135 @@
+# vectorized samplers for the attributes of a population. categorical attributes
+# are drawn as integer codes into the levels listed in parameters.person_params
+import numpy as np
+import parameters as pm
+
+
+def check_probabilities(probabilities, attributes, totals=None):
+    """
+    probabilities as a float array, raising ValueError unless it has one axis per attribute
+    with one entry per level of it, and is non-negative. totals are the sums, such as the row
+    sums of a conditional table, that must not be zero
+    """
+    probabilities = np.asarray(probabilities, dtype=float)
+    shape = tuple(len(pm.person_params[attribute]) for attribute in attributes)
+    if probabilities.shape != shape:
+        raise ValueError('probabilities of %s must have shape %s, not %s' % (
+            ', '.join(attributes), shape, probabilities.shape
+        ))
+    if (probabilities < 0).any():
+        raise ValueError('probabilities of %s must be non-negative' % ', '.join(attributes))
+    totals = probabilities.sum() if totals is None else totals(probabilities)
+    if not np.all(totals > 0):
+        raise ValueError('probabilities of %s must not sum to zero' % ', '.join(attributes))
+    return probabilities
+
+
+class Categorical:
+    """
+    independent draw of one categorical attribute, equally weighted unless weights are given
+    """
+    def __init__(self, attribute, weights=None):
+        self.attribute = attribute
+        n_levels = len(pm.person_params[attribute])
+        if weights is None:
+            weights = np.ones(n_levels)
+        weights = check_probabilities(weights, [attribute])
+        self.weights = weights / weights.sum()
+
+    def sample(self, size, rng, drawn):
+        return {self.attribute: rng.choice(len(self.weights), size=size, p=self.weights).astype(np.int8)}
+
+
+class Joint:
+    """
+    joint draw of several categorical attributes. probabilities has one axis per
+    attribute, in order, and one entry per combination of their levels
+    """
+    def __init__(self, attributes, probabilities):
+        self.attributes = attributes
+        probabilities = check_probabilities(probabilities, attributes)
+        self.shape = probabilities.shape
+        self.probabilities = probabilities.ravel() / probabilities.sum()
+
+    def sample(self, size, rng, drawn):
+        cells = rng.choice(len(self.probabilities), size=size, p=self.probabilities)
+        codes = np.unravel_index(cells, self.shape)
+        return {
+            attribute: code.astype(np.int8)
+            for attribute, code in zip(self.attributes, codes)
+        }
+
+
+class Conditional:
+    """
+    draw of a categorical attribute given one drawn before it, such as health status by age
+    class. probabilities has a row for each level of given and a column for each level of attribute
+    """
+    def __init__(self, attribute, given, probabilities):
+        self.attribute = attribute
+        self.given = given
+        probabilities = check_probabilities(probabilities, [given, attribute], lambda table: table.sum(axis=1))
+        self.cdf = np.cumsum(probabilities / probabilities.sum(axis=1, keepdims=True), axis=1)
+
+    def sample(self, size, rng, drawn):
+        cdf = self.cdf[drawn[self.given]]
+        codes = (rng.random(size)[:, np.newaxis] >= cdf[:, :-1]).sum(axis=1)
+        return {self.attribute: codes.astype(np.int8)}
+
+
+class Pareto:
+    """
+    pareto draw with shape b and minimum scale, as in scipy.stats.pareto
+    """
+    def __init__(self, attribute, b, scale):
+        self.attribute = attribute
+        self.b = b
+        self.scale = scale
+
+    def sample(self, size, rng, drawn):
+        return {self.attribute: self.scale * (1 + rng.pareto(self.b, size=size))}
+
+
+class Constant:
+    def __init__(self, attribute, value):
+        self.attribute = attribute
+        self.value = value
+
+    def sample(self, size, rng, drawn):
+        return {self.attribute: np.full(size, self.value, dtype=float)}
+
+
+SAMPLERS = {
+    'categorical': Categorical,
+    'joint': Joint,
+    'conditional': Conditional,
+    'pareto': Pareto,
+    'constant': Constant
+}
+
+
+def register_sampler(name, sampler):
+    """
+    make a sampler class available to population configurations under name. a sampler
+    takes its parameters as keyword arguments and has a sample(size, rng, drawn) method that
+    returns a dict of attribute arrays, where drawn holds the attributes drawn before it
+    """
+    SAMPLERS[name] = sampler
+
+
+def build_samplers(config):
+    """
+    instantiate a population configuration, a list of (sampler name, keyword arguments)
+    pairs such as parameters.population_samplers
+    """
+    return [SAMPLERS[name](**kwargs) for name, kwargs in config]
+
+
+def draw_attributes(size, rng, samplers):
+    """
+    draw every attribute of size people, in the order the samplers are given
+    """
+    drawn = {}
+    for sampler in samplers:
+        drawn.update(sampler.sample(size, rng, drawn))
+    return drawn
@@ -1,4 +1,5 @@
-from random import choices
+import numpy as np
+import pandas as pd
 
 INITIAL_PREMIUM = 4000
 
@@ -62,35 +63,145 @@ el_p_params = {
 }
 
 
-def draw_ac(n):
-    return choices(person_params['age_class'], k=n)
-
-
-def draw_prof(n):
-    return choices(person_params['profession'], k=n)
-
-
-def draw_hs(n):
-    return choices(person_params['health_status'], k=n)
-
-
-def draw_el(n):
-    return choices(person_params['education_level'], k=n)
-
-
-def get_gamma_scale(people):
-    scale = people['age_class'].map(age_params) + \
-            people['profession'].map(prof_params) +\
-            people['health_status'].map(hs_params) +\
-            people['education_level'].map(el_params)
-
-    return scale
+# how each person attribute is drawn, as (sampler name, keyword arguments) pairs, see
+# mies.models.samplers. a joint or conditional sampler can replace the independent ones,
+# e.g. ('conditional', {'attribute': 'health_status', 'given': 'age_class',
+#                       'probabilities': [[.2, .3, .5], [.3, .4, .3], [.5, .3, .2]]})
+population_samplers = [
+    ('categorical', {'attribute': 'age_class'}),
+    ('categorical', {'attribute': 'profession'}),
+    ('categorical', {'attribute': 'health_status'}),
+    ('categorical', {'attribute': 'education_level'}),
+    ('pareto', {'attribute': 'income', 'b': 1, 'scale': person_params['income']}),
+    ('constant', {'attribute': 'cobb_c', 'value': person_params['cobb_c']}),
+    ('constant', {'attribute': 'cobb_d', 'value': person_params['cobb_d']})
+]
+
+# loss models used by God.smite, as (model name, keyword arguments) pairs or as dicts of keyword
+# arguments with the model name under 'name', see mies.models.losses
+frequency_model = ('poisson', {})
+severity_model = ('gamma', {'shape': 2})
+report_lag = ('immediate', {})
+
+# common shocks drawn on top of the loss models, as dicts of mies.models.catastrophe.Peril
+# arguments, e.g. {'name': 'epidemic', 'probability': .05, 'affected': {'health_status': ['P']},
+#                  'frequency_loading': 3, 'severity_loading': 1.5}
+catastrophes = []
+
+# how the population changes between periods, as (transition name, keyword arguments) pairs,
+# see mies.models.dynamics, e.g. aging, income growth and turnover:
+# [('markov', {'attribute': 'age_class', 'transitions': [[.9, .1, 0], [0, .95, .05], [0, 0, 1]]}),
+#  ('growth', {'attribute': 'income', 'rate': .02}),
+#  ('exit', {'probability': [.001, .005, .05], 'given': 'age_class'}),
+#  ('entry', {'rate': .02})]
+population_dynamics = []
+
+RATING_FACTORS = [
+    'age_class',
+    'profession',
+    'health_status',
+    'education_level'
+]
+
+# severity and frequency parameters of each rating factor, by level
+scale_params = {
+    'age_class': age_params,
+    'profession': prof_params,
+    'health_status': hs_params,
+    'education_level': el_params
+}
 
+lambda_params = {
+    'age_class': age_p_params,
+    'profession': prof_p_params,
+    'health_status': hs_p_params,
+    'education_level': el_p_params
+}
 
-def get_poisson_lambda(people):
-    lam = people['age_class'].map(age_p_params) + \
-             people['profession'].map(prof_p_params) + \
-             people['health_status'].map(hs_p_params) + \
-             people['education_level'].map(el_p_params)
+# each level of a rating factor is coded by its position in person_params, and the
+# four codes are packed into one small integer risk cell, age class most significant
+N_LEVELS = [len(person_params[factor]) for factor in RATING_FACTORS]
+N_CELLS = int(np.prod(N_LEVELS))
+
+
+def encode_levels(levels, factor):
+    """
+    integer codes of an array of rating factor levels, raising ValueError on levels
+    that are not in person_params
+    """
+    codes = pd.Categorical(levels, categories=person_params[factor]).codes
+    if (codes < 0).any():
+        unknown = pd.unique(np.asarray(levels, dtype=object)[codes < 0])
+        raise ValueError('unknown %s levels: %s' % (factor, ', '.join(map(str, unknown))))
+    return codes
+
+
+def decode_levels(codes, factor):
+    return np.array(person_params[factor], dtype=object)[codes]
+
+
+def encode_risk_cells(codes):
+    """
+    pack a list of code arrays, one per rating factor, into risk cells. codes outside
+    the levels of their factor raise ValueError rather than landing in another cell
+    """
+    cells = np.zeros(len(codes[0]), dtype=np.int64)
+    for factor, code, n_levels in zip(RATING_FACTORS, codes, N_LEVELS):
+        code = np.asarray(code)
+        if ((code < 0) | (code >= n_levels)).any():
+            raise ValueError('%s codes must lie in [0, %d)' % (factor, n_levels))
+        cells = cells * n_levels + code
+    return cells
+
+
+def decode_risk_cells(cells):
+    """
+    unpack risk cells into a list of code arrays, one per rating factor
+    """
+    cells = np.asarray(cells)
+    codes = []
+    for n_levels in reversed(N_LEVELS):
+        codes.append(cells % n_levels)
+        cells = cells // n_levels
+    return codes[::-1]
+
+
+def get_risk_cells(people):
+    """
+    risk cell of each person, parsing the rating factor columns only if the
+    frame does not carry a risk_cell column already
+    """
+    if 'risk_cell' in people:
+        return people['risk_cell'].values
+    return encode_risk_cells([encode_levels(people[factor], factor) for factor in RATING_FACTORS])
+
+
+def compile_factor_tables(params):
+    """
+    lookup array of the parameter of each level, by rating factor
+    """
+    return [
+        np.array([params[factor][level] for level in person_params[factor]], dtype=float)
+        for factor in RATING_FACTORS
+    ]
+
+
+def compile_cell_table(params):
+    """
+    lookup array of the additive parameter of each risk cell
+    """
+    codes = decode_risk_cells(np.arange(N_CELLS))
+    tables = compile_factor_tables(params)
+    return sum(table[code] for table, code in zip(tables, codes))
+
+
+def get_risk_cell_frame():
+    """
+    one row per risk cell with its rating factor levels
+    """
+    codes = decode_risk_cells(np.arange(N_CELLS))
+    cells = pd.DataFrame({'risk_cell': np.arange(N_CELLS)})
+    for factor, code in zip(RATING_FACTORS, codes):
+        cells[factor] = decode_levels(code, factor)
+    return cells
 
-    return lam
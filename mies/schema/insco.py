@@ -18,6 +18,7 @@ class Customer(Base):
     profession = Column(String)
     health_status = Column(String)
     education_level = Column(String)
+    risk_cell = Column(Integer)
 
     policy = relationship(
         "Policy",
@@ -50,8 +51,15 @@ class Policy(Base):
         ForeignKey('customer.person_id')
     )
     effective_date = Column(Date)
-    expiration_date = Column(Date)
+    # indexed for the in-force lookups of the broker
+    expiration_date = Column(Date, index=True)
     premium = Column(Float)
+    # rating factors of the person when the policy was placed, which the customer's may have moved on from
+    age_class = Column(String)
+    profession = Column(String)
+    health_status = Column(String)
+    education_level = Column(String)
+    risk_cell = Column(Integer)
 
     customer = relationship(
         "Customer",
@@ -17,9 +17,12 @@ class PersonTable(Base):
     profession = Column(String)
     health_status = Column(String)
     education_level = Column(String)
+    risk_cell = Column(Integer)
     income = Column(Float)
     cobb_c = Column(Float)
     cobb_d = Column(Float)
+    # set when the person leaves the population, see God.evolve
+    exit_date = Column(Date)
 
     event = relationship(
         "Event",
@@ -92,6 +95,9 @@ class Event(Base):
     )
     event_date = Column(Date)
     report_date = Column(Date)
+    # the same dates as day ordinals, date.toordinal(), for cheap range filters and sorting
+    event_day = Column(Integer, index=True)
+    report_day = Column(Integer, index=True)
     person_id = Column(
         Integer,
         ForeignKey('person.person_id')
@@ -1,3 +1,6 @@
+import copy
+import os
+import numpy as np
 import pandas as pd
 import datetime as dt
 
@@ -5,152 +8,377 @@ from mies.entities.god import God
 from mies.entities.bank import Bank
 from mies.entities.broker import Broker
 from mies.entities.insurer import Insurer
-from mies.utilities.queries import query_population, query_customers_by_person_id
+from mies.entities import memory
+from mies.utilities.checkpoint import load_checkpoint, save_checkpoint
+from mies.utilities.connections import unit_of_work
 
 
 pd.set_option('display.max_columns', None)
 
-
-ahura = God()
-
-ahura.make_population(1000)
-
-pricing_date = dt.date(1, 12, 31)
-
-blargo = Bank(4000000, 'blargo')
-rayon = Broker()
-
-company_1 = Insurer(4000000, blargo, pricing_date, 'company_1')
-
-company_2 = Insurer(4000000, blargo, pricing_date, 'company_2')
-
-company_1_formula = 'incurred_loss ~ ' \
-                    'age_class + ' \
-                    'profession + ' \
-                    'health_status + ' \
-                    'education_level'
-
-company_2_formula = 'incurred_loss ~' \
-                    ' age_class'
-
-
-population = query_population()
-ids = population['person_id']
-
-blargo.get_customers(ids=ids, customer_type='person')
-customer_ids = query_customers_by_person_id(ids, 'blargo')
-blargo.assign_accounts(customer_ids=customer_ids, account_type='cash')
-ahura.grant_wealth(person_ids=ids, bank=blargo, transaction_date=pricing_date)
-
-
-
-policy_count = pd.DataFrame(columns=['year', 'company_1', 'company_2', 'company_1_prem', 'company_2_prem'])
-for i in range(50):
-
-    rayon.place_business(
-        pricing_date,
-        blargo,
-        company_1,
-        company_2
+# entity classes of each storage backend
+BACKENDS = {
+    'sqlite': (God, Bank, Broker, Insurer),
+    'memory': (memory.God, memory.Bank, memory.Broker, memory.Insurer)
+}
+
+
+def broker_seed(seed):
+    """
+    seed of the broker's generator, drawn from seed independently of the stream god draws with it
+    """
+    if seed is None:
+        return None
+    return np.random.SeedSequence(seed).spawn(1)[0]
+
+
+class Simulation:
+    """
+    a population, a bank, a broker and a set of competing insurers, advanced one
+    underwriting period at a time. formulas maps each company name to its pricing formula,
+    which is fit as a tweedie glm with variance power var_power. seed seeds the population and
+    its losses, and the draws of the broker through a stream of its own, see broker_seed.
+    with period_days, events are spread over that many days of each period, and report_lag
+    configures the delay before they are reported, see mies.models.losses. claims reported
+    by the event date of a period are settled the day after it, and the rest in the period
+    in which the event date passes their report date. with settle_at_period_end, every claim
+    reported by the end of the period is settled the day after it instead, which is the default
+    once period_days or report_lag is given, since few claims may be reported by the event date
+    of the first period for the companies to price on. catastrophes
+    lists the perils that shock groups of people together, see mies.models.catastrophe, and
+    dynamics how the population ages, grows and turns over, see mies.models.dynamics.
+    with consumer_choice, people only insure when their demand at the best premium comes to
+    take_up_threshold policies, see mies.models.market.take_up.
+    quote_executor, a concurrent.futures executor, lets the insurers quote in parallel, and
+    placement='logit' has people choose among the quotes rather than take the cheapest.
+    the memory backend keeps all tables in memory until god.persist is called
+    """
+    def __init__(
+        self,
+        formulas,
+        n_people=1000,
+        starting_capital=4000000,
+        bank_capital=4000000,
+        pricing_date=dt.date(1, 12, 31),
+        backend='sqlite',
+        var_power=1.5,
+        seed=None,
+        period_days=None,
+        report_lag=None,
+        settle_at_period_end=None,
+        catastrophes=None,
+        dynamics=None,
+        consumer_choice=False,
+        take_up_threshold=1.,
+        quote_executor=None,
+        placement='cheapest'
+    ):
+        god, bank, broker, insurer = BACKENDS[backend]
+        self.backend = backend
+        self.formulas = formulas
+        self.var_power = var_power
+        if settle_at_period_end is None:
+            settle_at_period_end = period_days is not None or report_lag is not None
+        self.settle_at_period_end = settle_at_period_end
+        self.inception_date = pricing_date
+        self.pricing_date = pricing_date
+        self.n_people = n_people
+        self.period = 0
+        self.history = []
+
+        self.god = god(seed, report_lag=report_lag, period_days=period_days, catastrophes=catastrophes, dynamics=dynamics)
+        self.god.make_population(n_people)
+
+        self.bank = bank(bank_capital, 'blargo')
+        self.broker = broker(
+            consumer_choice=consumer_choice,
+            take_up_threshold=take_up_threshold,
+            executor=quote_executor,
+            placement=placement,
+            seed=broker_seed(seed)
+        )
+
+        self.insurers = [
+            insurer(starting_capital, self.bank, pricing_date, company_name)
+            for company_name in formulas
+        ]
+
+        self.person_ids = pd.Series(dtype=int)
+        self.__open_accounts(self.god.get_exposure()['person_id'])
+        self.god.grant_wealth(person_ids=self.person_ids, bank=self.bank, transaction_date=pricing_date)
+
+    def __open_accounts(self, person_ids):
+        # make the people bank customers with a cash account each
+        person_ids = pd.Series(person_ids, name='person_id')
+        self.person_ids = pd.concat([self.person_ids, person_ids], ignore_index=True)
+
+        self.bank.get_customers(ids=person_ids, customer_type='person')
+        customer_ids = self.bank.customers_by_type_id(person_ids, 'person')
+        self.bank.assign_accounts(customer_ids=customer_ids, account_type='cash')
+
+    def reset(self, keep_population=True, seed=None):
+        """
+        return to the inception date for another replication without recreating the databases.
+        the events, policies, claims and transactions are cleared in place and every company
+        is funded again. with keep_population the people, as population dynamics have left them,
+        and their bank accounts are kept,
+        otherwise a new population of the same size is drawn. seed reseeds god's and the broker's generators
+        """
+        self.god.reset(keep_population, seed)
+        self.bank.reset(keep_people=keep_population)
+        self.broker.reset(broker_seed(seed))
+        for insurer in self.insurers:
+            insurer.reset()
+
+        self.pricing_date = self.inception_date
+        self.period = 0
+        self.history = []
+
+        if not keep_population:
+            self.god.make_population(self.n_people)
+            self.person_ids = pd.Series(dtype=int)
+            self.__open_accounts(self.god.get_exposure()['person_id'])
+        self.god.grant_wealth(person_ids=self.person_ids, bank=self.bank, transaction_date=self.inception_date)
+
+    @property
+    def connections(self):
+        """
+        the connection each entity holds to its database, none on the memory backend
+        """
+        connections = [self.god.connection, self.bank.connection]
+        connections += [insurer.connection for insurer in self.insurers]
+        return [connection for connection in connections if connection is not None]
+
+    def run_period(self):
+        """
+        advance one period. on the sqlite backend every write of the period goes into one
+        transaction on the connection each entity holds to its database, which an exception
+        rolls back, see mies.utilities.connections.unit_of_work. the in-memory state of the
+        simulation and its entities is then put back as it was, so that the period can be run
+        again. the memory backend has no transaction to roll back and keeps what the period wrote
+        """
+        connections = self.connections
+        state = self.__save_state()
+        try:
+            with unit_of_work(connections):
+                self.__advance()
+        except BaseException:
+            if connections:
+                self.__restore_state(state)
+            raise
+
+    def __save_state(self):
+        # the in-memory state a period changes. everything else a period changes it assigns anew
+        # rather than modifying, except the generators, which are copied, and god's exposure and
+        # payroll schedules, which are caches of the databases and simply rebuilt after a rollback
+        return {
+            'simulation': (self.pricing_date, self.period, list(self.history), self.person_ids),
+            'god': (copy.deepcopy(self.god.rng), dict(self.god.fate), self.god.strikes),
+            'broker': (copy.deepcopy(self.broker.rng), self.broker.reported_through),
+            'insurers': [
+                (
+                    insurer.pricing_model,
+                    insurer.rate_table,
+                    insurer.pricing_formula,
+                    insurer.pricing_var_power,
+                    insurer.pricing_book
+                )
+                for insurer in self.insurers
+            ]
+        }
+
+    def __restore_state(self, state):
+        self.pricing_date, self.period, self.history, self.person_ids = state['simulation']
+        self.god.rng, self.god.fate, self.god.strikes = state['god']
+        self.god.exposure = None
+        self.god.payroll = {}
+        self.broker.rng, self.broker.reported_through = state['broker']
+        for insurer, insurer_state in zip(self.insurers, state['insurers']):
+            (
+                insurer.pricing_model,
+                insurer.rate_table,
+                insurer.pricing_formula,
+                insurer.pricing_var_power,
+                insurer.pricing_book
+            ) = insurer_state
+
+    def __advance(self):
+        self.broker.place_business(
+            self.pricing_date,
+            self.bank,
+            *self.insurers,
+            connection=self.god.connection
+        )
+
+        event_date = self.event_date(self.pricing_date)
+
+        self.god.smite(event_date)
+
+        period_end = self.pricing_date.replace(self.pricing_date.year + 1)
+
+        # claims are reported through, and settled the day after, the event date or the period end
+        settlement_date = period_end if self.settle_at_period_end else event_date
+
+        self.broker.report_claims(settlement_date, *self.insurers, connection=self.god.connection)
+
+        for insurer in self.insurers:
+            insurer.pay_claims(settlement_date + dt.timedelta(days=1))
+
+        for insurer in self.insurers:
+            insurer.price_book(self.formulas[insurer.company_name], self.var_power)
+
+        self.pricing_date = period_end
+
+        entrants, leavers = self.god.evolve(self.pricing_date)
+        if len(entrants) or len(leavers):
+            self.person_ids = self.person_ids[~self.person_ids.isin(leavers)]
+        if len(entrants):
+            self.__open_accounts(entrants)
+            self.god.grant_wealth(person_ids=entrants, bank=self.bank, transaction_date=self.pricing_date)
+
+        self.god.send_paychecks(person_ids=self.person_ids, bank=self.bank, transaction_date=self.pricing_date)
+
+        record = {'year': self.pricing_date.year}
+        for insurer in self.insurers:
+            in_force = insurer.in_force(self.pricing_date)
+            record[insurer.company_name] = len(in_force)
+            record[insurer.company_name + '_prem'] = in_force['premium'].mean()
+        self.history.append(record)
+
+        self.period += 1
+
+    @staticmethod
+    def event_date(pricing_date):
+        return pricing_date + dt.timedelta(days=1)
+
+    def run(self, n_periods, checkpoint_dir=None, foresee=False):
+        """
+        run n_periods periods, saving a checkpoint at the end of each one if checkpoint_dir is given.
+        with foresee, the losses of all n_periods periods are drawn up front in one batch
+        """
+        if foresee:
+            self.god.foresee([
+                self.event_date(self.pricing_date.replace(self.pricing_date.year + i))
+                for i in range(n_periods)
+            ])
+
+        for i in range(n_periods):
+            self.run_period()
+            if checkpoint_dir is not None:
+                self.save(os.path.join(checkpoint_dir, 'period_' + str(self.period)))
+
+    def get_insurer(self, company_name):
+        for insurer in self.insurers:
+            if insurer.company_name == company_name:
+                return insurer
+        raise KeyError(company_name)
+
+    @property
+    def policy_count(self):
+        return pd.DataFrame(self.history)
+
+    def save(self, path):
+        return save_checkpoint(self, path)
+
+    @classmethod
+    def resume(cls, path):
+        """
+        restore a simulation from a checkpoint written by save
+        """
+        return load_checkpoint(path)
+
+
+if __name__ == '__main__':
+    company_1_formula = 'incurred_loss ~ ' \
+                        'age_class + ' \
+                        'profession + ' \
+                        'health_status + ' \
+                        'education_level'
+
+    company_2_formula = 'incurred_loss ~' \
+                        ' age_class'
+
+    simulation = Simulation(
+        formulas={
+            'company_1': company_1_formula,
+            'company_2': company_2_formula
+        },
+        n_people=1000
     )
 
-    event_date = pricing_date + dt.timedelta(days=1)
-
-    ahura.smite(event_date)
-
-    rayon.report_claims(event_date)
-
-    company_1.pay_claims(event_date + dt.timedelta(days=1))
-
-    company_2.pay_claims(event_date + dt.timedelta(days=1))
-
-    company_1.price_book(company_1_formula)
-
-    company_2.price_book(company_2_formula)
-
-    pricing_date = pricing_date.replace(pricing_date.year + 1)
-
-
-    ahura.send_paychecks(person_ids=ids, bank=blargo, transaction_date=pricing_date)
-
-    policy_count = policy_count.append({
-        'year': pricing_date.year,
-        'company_1': len(company_1.in_force(pricing_date)),
-        'company_2': len(company_2.in_force(pricing_date)),
-        'company_1_prem': company_1.in_force(pricing_date)['premium'].mean(),
-        'company_2_prem': company_2.in_force(pricing_date)['premium'].mean()
-    }, ignore_index=True)
-
-policy_count = policy_count.groupby(['year'])[['company_1',
-                                               'company_2',
-                                               'company_1_prem',
-                                               'company_2_prem'
-                                               ]].mean().reset_index()
+    # a crashed or modified run can pick up from the last saved period with
+    # simulation = Simulation.resume('checkpoints/period_<n>')
+    simulation.run(50, checkpoint_dir='checkpoints')
 
+    policy_count = simulation.policy_count
 
-import plotly.graph_objects as go
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1'],
-                         mode='lines',
-                         name='Company 1'))
+    policy_count = policy_count.groupby(['year'])[['company_1',
+                                                   'company_2',
+                                                   'company_1_prem',
+                                                   'company_2_prem'
+                                                   ]].mean().reset_index()
 
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1'],
+                             mode='lines',
+                             name='Company 1'))
 
-fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2'],
-                         mode='lines',
-                         name='Company 2'))
 
-fig.update_layout(title='Insurer Market Share',
-                  title_x=0.5,
-                  xaxis_title='Underwriting Period',
-                  yaxis_title='Policy Count',
-                  yaxis_range=[0, 1000])
+    fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2'],
+                             mode='lines',
+                             name='Company 2'))
 
-fig['layout'].update({
-            'title_x': 0.45,
-            'width': 550,
-            'height': 400,
-            'margin': {
-                'l':10
-            }
-})
+    fig.update_layout(title='Insurer Market Share',
+                      title_x=0.5,
+                      xaxis_title='Underwriting Period',
+                      yaxis_title='Policy Count',
+                      yaxis_range=[0, 1000])
 
-fig.write_html('first_figure3.html', auto_open=True)
+    fig['layout'].update({
+                'title_x': 0.45,
+                'width': 550,
+                'height': 400,
+                'margin': {
+                    'l':10
+                }
+    })
 
+    fig.write_html('first_figure3.html', auto_open=True)
 
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1'],
-                         mode='lines',
-                         name='Company 1'))
 
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1'],
+                             mode='lines',
+                             name='Company 1'))
 
-fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2'],
-                         mode='lines',
-                         name='Company 2'))
 
-fig.update_layout(title='Insurer Market Share',
-                  title_x=0.5,
-                  xaxis_title='Underwriting Period',
-                  yaxis_title='Policy Count',
-                  yaxis_range=[0, 800])
+    fig.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2'],
+                             mode='lines',
+                             name='Company 2'))
 
-fig.write_html('first_figure6.html', auto_open=True)
+    fig.update_layout(title='Insurer Market Share',
+                      title_x=0.5,
+                      xaxis_title='Underwriting Period',
+                      yaxis_title='Policy Count',
+                      yaxis_range=[0, 800])
 
-fig2 = go.Figure()
-fig2.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1_prem'],
-                         mode='lines',
-                         name='Company 1'))
+    fig.write_html('first_figure6.html', auto_open=True)
 
+    fig2 = go.Figure()
+    fig2.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_1_prem'],
+                             mode='lines',
+                             name='Company 1'))
 
-fig2.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2_prem'],
-                         mode='lines',
-                         name='Company 2'))
 
+    fig2.add_trace(go.Scatter(x=policy_count['year'], y=policy_count['company_2_prem'],
+                             mode='lines',
+                             name='Company 2'))
 
-fig2.update_layout(title='Average Premium per Policy',
-                  title_x=0.5,
-                  xaxis_title='Underwriting Period',
-                  yaxis_title='Average Premium')
-                  #yaxis_range=[0, 600])
 
-fig2.write_html('first_figure7.html', auto_open=True)
+    fig2.update_layout(title='Average Premium per Policy',
+                      title_x=0.5,
+                      xaxis_title='Underwriting Period',
+                      yaxis_title='Average Premium')
+                      #yaxis_range=[0, 600])
 
+    fig2.write_html('first_figure7.html', auto_open=True)
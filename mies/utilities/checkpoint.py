@@ -0,0 +1,92 @@
+# snapshot and restore a simulation at a period boundary
+import os
+import pickle
+import random
+import shutil
+import sqlite3
+
+import numpy as np
+
+DB_PATH = 'db'
+STATE_FILE = 'state.pkl'
+
+
+def list_databases(db_path=DB_PATH):
+    """
+    returns the path of every database under db_path, relative to db_path
+    """
+    databases = []
+    for root, dirs, files in os.walk(db_path):
+        for file in files:
+            if file.endswith('.db'):
+                databases.append(os.path.relpath(os.path.join(root, file), db_path))
+    return sorted(databases)
+
+
+def backup_database(source, target):
+    """
+    copy a database with the sqlite backup api, which is consistent even while
+    other connections to the source are open
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    with target_connection:
+        source_connection.backup(target_connection)
+    target_connection.close()
+    source_connection.close()
+
+
+def save_checkpoint(state, path, db_path=DB_PATH):
+    """
+    snapshot every database under db_path, the global random number generator states
+    and a pickle of state, which should hold the entities, fitted pricing models and dates
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    for database in list_databases(db_path):
+        backup_database(
+            os.path.join(db_path, database),
+            os.path.join(path, DB_PATH, database)
+        )
+
+    snapshot = {
+        'state': state,
+        'random_state': random.getstate(),
+        'numpy_state': np.random.get_state()
+    }
+
+    with open(os.path.join(path, STATE_FILE), 'wb') as file:
+        pickle.dump(snapshot, file)
+
+    return path
+
+
+def restore_databases(path, db_path=DB_PATH, copy_function=shutil.copy2):
+    """
+    replace the databases under db_path with the ones saved in a checkpoint
+    """
+    if os.path.exists(db_path):
+        shutil.rmtree(db_path)
+    # simulations on the in-memory backend checkpoint no databases
+    if os.path.exists(os.path.join(path, DB_PATH)):
+        shutil.copytree(os.path.join(path, DB_PATH), db_path, copy_function=copy_function)
+
+
+def load_checkpoint(path, db_path=DB_PATH, copy_function=shutil.copy2):
+    """
+    restore the databases and random number generator states saved in a checkpoint
+    and return the saved state. databases are restored before unpickling, since
+    entities reconnect to them as they are unpickled
+    """
+    restore_databases(path, db_path, copy_function)
+
+    with open(os.path.join(path, STATE_FILE), 'rb') as file:
+        snapshot = pickle.load(file)
+
+    random.setstate(snapshot['random_state'])
+    np.random.set_state(snapshot['numpy_state'])
+
+    return snapshot['state']
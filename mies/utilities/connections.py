@@ -1,7 +1,46 @@
+import os
+
 import sqlalchemy as sa
+
+from contextlib import contextmanager
+from functools import partial
+
 from sqlalchemy.orm import sessionmaker
 
 
+class SqliteMixin:
+    """
+    engine, connection and session of an entity kept in the sqlite database at its database_path,
+    created with the tables of its schema. they are reopened on unpickling, see mies.utilities.checkpoint
+    """
+    schema = None
+
+    @property
+    def database_path(self):
+        raise NotImplementedError
+
+    def _connect(self):
+        directory = os.path.dirname(self.database_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.engine = sa.create_engine('sqlite:///' + self.database_path, echo=True)
+        self.schema.metadata.create_all(self.engine)
+        self.connection = self.engine.connect()
+        # the session writes through the connection, so that its writes join any transaction begun on it
+        self.session = sessionmaker(bind=self.connection)()
+
+    def __getstate__(self):
+        state = dict(getattr(super(), '__getstate__', lambda: self.__dict__)())
+        del state['engine'], state['session'], state['connection']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+        if hasattr(super(), '__setstate__'):
+            super().__setstate__(state)
+
+
 def connect_universe():
     engine = sa.create_engine(
         'sqlite:///db/universe.db',
@@ -30,3 +69,69 @@ def connect_bank(bank_name):
     session = sessionmaker(bind=engine)()
     connection = engine.connect()
     return session, connection
+
+
+@contextmanager
+def connection_scope(connect, connection=None):
+    """
+    session and connection for a query to run through. a connection passed in, such as one
+    an entity holds, is used and left open, so that the query sees the writes of any transaction
+    it is in. otherwise connect, one of the functions above, opens one that is closed afterwards
+    """
+    if connection is not None:
+        yield sessionmaker(bind=connection)(), connection
+        return
+    session, connection = connect()
+    try:
+        yield session, connection
+    finally:
+        connection.close()
+
+
+def universe_scope(connection=None):
+    return connection_scope(connect_universe, connection)
+
+
+def company_scope(company_name, connection=None):
+    return connection_scope(partial(connect_company, company_name), connection)
+
+
+def bank_scope(bank_name, connection=None):
+    return connection_scope(partial(connect_bank, bank_name), connection)
+
+
+@contextmanager
+def unit_of_work(connections):
+    """
+    one transaction on each of connections, one connection per database, for the duration of the
+    block. every write made through them, including through sessions bound to them, is committed
+    when the block completes and rolled back in every database when it raises, so that an
+    interrupted period leaves nothing behind. sqlite commits separate files one at a time, so
+    only a failure while committing can leave some databases ahead of the others
+    """
+    transactions = [connection.begin() for connection in connections]
+    try:
+        yield
+    except BaseException:
+        for transaction in transactions:
+            transaction.rollback()
+        raise
+    else:
+        for transaction in transactions:
+            transaction.commit()
+
+
+def truncate_tables(connection, tables):
+    """
+    delete every row of each table in tables in one transaction and restart their
+    primary keys, which sqlite otherwise assigns counting up from the largest one left
+    """
+    with connection.begin():
+        for table in tables:
+            connection.execute(sa.text('DELETE FROM "%s"' % table))
+        sequences = connection.execute(sa.text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'"
+        )).fetchall()
+        if sequences:
+            for table in tables:
+                connection.execute(sa.text('DELETE FROM sqlite_sequence WHERE name = :table'), {'table': table})
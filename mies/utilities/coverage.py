@@ -0,0 +1,63 @@
+# match events to the policies covering them through an index of policy periods,
+# sorted by person and effective date, instead of merging events with every policy
+import numpy as np
+import pandas as pd
+
+# person ids are shifted past every day ordinal (date.max.toordinal() < 2 ** 22) so that one
+# sorted int64 key orders policies by person and then by effective day
+DAY_BITS = 22
+
+
+def dates_to_days(dates):
+    """
+    day ordinals of an array of dates, converting each distinct date only once
+    """
+    unique_dates, inverse = np.unique(np.asarray(dates, dtype=object), return_inverse=True)
+    days = np.array([date.toordinal() for date in unique_dates], dtype=np.int64)
+    return days[inverse]
+
+
+class CoverageIndex:
+    """
+    the periods of a set of policies, a frame with person_id, effective_date and
+    expiration_date columns. a person is expected to hold at most one policy on any day
+    """
+    def __init__(self, policies):
+        policies = policies.reset_index(drop=True)
+        person_ids = policies['person_id'].values.astype(np.int64)
+        effective_days = dates_to_days(policies['effective_date'])
+        order = np.argsort((person_ids << DAY_BITS) + effective_days, kind='stable')
+
+        self.policies = policies.iloc[order].reset_index(drop=True)
+        self.person_ids = person_ids[order]
+        self.keys = (self.person_ids << DAY_BITS) + effective_days[order]
+        self.expiration_days = dates_to_days(self.policies['expiration_date'])
+
+    def locate(self, person_ids, days):
+        """
+        position in the index of the policy covering each person on each day, -1 where none does
+        """
+        person_ids = np.asarray(person_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.full(len(person_ids), -1)
+        # the last policy of the person taking effect on or before the day
+        positions = np.searchsorted(self.keys, (person_ids << DAY_BITS) + days, side='right') - 1
+        found = np.maximum(positions, 0)
+        covered = (
+            (positions >= 0) &
+            (self.person_ids[found] == person_ids) &
+            (self.expiration_days[found] >= days)
+        )
+        return np.where(covered, positions, -1)
+
+    def match(self, events):
+        """
+        each event in events, with person_id and event_day columns, that a policy covers,
+        joined with the columns of that policy
+        """
+        positions = self.locate(events['person_id'].values, events['event_day'].values)
+        covered = positions >= 0
+        policies = self.policies.iloc[positions[covered]].reset_index(drop=True)
+        events = events[covered].reset_index(drop=True)
+        return pd.concat([events, policies.drop(columns='person_id')], axis=1)
@@ -13,9 +13,11 @@ from mies.schema.universe import (
     PersonTable)
 
 from mies.utilities.connections import (
+    company_scope,
     connect_bank,
     connect_universe,
-    connect_company)
+    connect_company,
+    universe_scope)
 
 from mies.utilities.queries.bank_queries import (
     query_accounts_by_person_id
@@ -46,6 +48,30 @@ def query_all_policies():
     return policies
 
 
+def query_policies_in_force_between(start_date, end_date, connection=None, company_connections=None):
+    """
+    returns the policies of all insurers in force at any time from start_date through end_date.
+    company_connections maps the names of companies to connections to read their policies through
+    """
+    companies = query_company(connection)
+    company_connections = company_connections or {}
+    policies = [pd.DataFrame(columns=[column.name for column in Policy.__table__.columns])]
+
+    for index, row in companies.iterrows():
+        company_connection = company_connections.get(row['company_name'])
+        with company_scope(row['company_name'], company_connection) as (session, company_connection):
+            query = session.query(Policy).filter(
+                Policy.effective_date <= end_date,
+                Policy.expiration_date >= start_date
+            ).statement
+            policy_c = pd.read_sql(query, company_connection)
+        policy_c['company_id'] = row['company_id']
+        policy_c['company_name'] = row['company_name']
+        policies.append(policy_c)
+
+    return pd.concat(policies, ignore_index=True)
+
+
 def query_bank_id(bank_name):
     """
     takes a bank name and returns the id of that bank
@@ -71,17 +97,16 @@ def query_banks():
     return banks
 
 
-def query_company():
+def query_company(connection=None):
     """
     returns the company table from universe db
     """
-    session, connection = connect_universe()
-    companies_query = session.query(Company).statement
-    companies = pd.read_sql(
-        companies_query,
-        connection
-    )
-    connection.close()
+    with universe_scope(connection) as (session, connection):
+        companies_query = session.query(Company).statement
+        companies = pd.read_sql(
+            companies_query,
+            connection
+        )
     return companies
 
 
@@ -96,17 +121,16 @@ def get_company_ids():
     return list(companies['company_id'])
 
 
-def get_company_names():
+def get_company_names(connection=None):
     """
     return company names
     """
-    session, connection = connect_universe()
-    companies_query = session.query(Company.company_name).statement
-    companies = pd.read_sql(
-        companies_query,
-        connection
-    )
-    connection.close()
+    with universe_scope(connection) as (session, connection):
+        companies_query = session.query(Company.company_name).statement
+        companies = pd.read_sql(
+            companies_query,
+            connection
+        )
     return list(companies['company_name'])
 
 
@@ -140,26 +164,23 @@ def query_in_force_policies(curr_date):
     return in_force
 
 
-def query_incomes(person_ids):
+def query_incomes(person_ids, connection=None):
     """
     takes a list of person ids and returns the incomes for each person
     """
-    session, connection = connect_universe()
-
-    income_query = session.query(
-        PersonTable.person_id,
-        PersonTable.income
-    ).statement
-
-    incomes = pd.read_sql(
-        income_query,
-        connection
-    )
+    with universe_scope(connection) as (session, connection):
+        income_query = session.query(
+            PersonTable.person_id,
+            PersonTable.income
+        ).filter(PersonTable.exit_date.is_(None)).statement
+
+        incomes = pd.read_sql(
+            income_query,
+            connection
+        )
 
     incomes = incomes[incomes['person_id'].isin(person_ids)]
 
-    connection.close()
-
     return incomes
 
 
@@ -276,17 +297,43 @@ def query_policy_history(person_id):
     return policies
 
 
-def query_population():
+def query_population(connection=None):
     """
-    return the person table from universe db
+    return the person table from universe db, without the people who have left
     """
-    session, connection = connect_universe()
-    query = session.query(PersonTable).statement
-    population = pd.read_sql(query, connection)
-    connection.close()
+    with universe_scope(connection) as (session, connection):
+        query = session.query(PersonTable).filter(PersonTable.exit_date.is_(None)).statement
+        population = pd.read_sql(query, connection)
     return population
 
 
+def query_exposure(connection=None):
+    """
+    returns the person id and risk cell of everyone in the universe db, all that is needed to draw losses
+    """
+    with universe_scope(connection) as (session, connection):
+        query = session.query(
+            PersonTable.person_id,
+            PersonTable.risk_cell
+        ).filter(PersonTable.exit_date.is_(None)).statement
+        exposure = pd.read_sql(query, connection)
+    return exposure
+
+
+def query_person_state(connection=None):
+    """
+    returns the person id, risk cell and income of everyone in the universe db, what population dynamics act on
+    """
+    with universe_scope(connection) as (session, connection):
+        query = session.query(
+            PersonTable.person_id,
+            PersonTable.risk_cell,
+            PersonTable.income
+        ).filter(PersonTable.exit_date.is_(None)).statement
+        people = pd.read_sql(query, connection)
+    return people
+
+
 def query_population_wealth():
     """
     get wealth for each person in the population
@@ -387,6 +434,39 @@ def query_population_wealth():
     return pop_wealth
 
 
+def query_free_business(curr_date, connection=None, company_connections=None):
+    """
+    takes a date and returns everyone in the population who is free to be placed on that date:
+    the holders of policies expiring then, with their policy and the id of its company as
+    incumbent_id, and everyone else, with null policy columns, each along with their
+    attributes. the expiring policies of each company are read through its own connection,
+    the one company_connections maps its name to if any, and joined to the population in pandas
+    """
+    companies = query_company(connection)
+    company_connections = company_connections or {}
+    expiring = [pd.DataFrame(columns=[
+        'policy_id', 'person_id', 'effective_date', 'expiration_date', 'premium', 'incumbent_id'
+    ])]
+
+    for index, row in companies.iterrows():
+        company_connection = company_connections.get(row['company_name'])
+        with company_scope(row['company_name'], company_connection) as (session, company_connection):
+            query = session.query(
+                Policy.policy_id,
+                Policy.person_id,
+                Policy.effective_date,
+                Policy.expiration_date,
+                Policy.premium
+            ).filter(Policy.expiration_date == curr_date).statement
+            policy_c = pd.read_sql(query, company_connection)
+        policy_c['incumbent_id'] = row['company_id']
+        expiring.append(policy_c)
+
+    # the empty frame the policies are stacked on would otherwise leave person ids as objects
+    expiring = pd.concat(expiring, ignore_index=True).astype({'person_id': int})
+    return query_population(connection).merge(expiring, on='person_id', how='left')
+
+
 def get_uninsured_ids(curr_date):
     """
     takes a date and returns all person ids for people who are not insured on that date
@@ -0,0 +1,120 @@
+# fork what-if branches off a checkpoint and run them side by side
+import os
+import random
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from mies.simulation import broker_seed
+from mies.utilities.checkpoint import load_checkpoint
+
+# linux ioctl that makes target share the blocks of source until either is written
+FICLONE = 0x40049409
+
+
+def clone_file(source, target):
+    """
+    copy-on-write clone of a file on filesystems that support reflinks (btrfs, xfs),
+    so a branch only stores the pages it writes. on any other filesystem, such as ext4
+    or tmpfs, and off linux, this silently falls back to a full copy, so every branch
+    then costs as much disk and copy time as the checkpoint's databases
+    """
+    try:
+        import fcntl
+        with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        shutil.copystat(source, target)
+    except (ImportError, OSError):
+        shutil.copy2(source, target)
+    return target
+
+
+@contextmanager
+def working_directory(path):
+    """
+    run a block in path, creating it if needed. every database path is relative to the
+    working directory, so this is how a worker process keeps its databases to itself
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+def _set_formula(simulation, company_name, formula):
+    simulation.formulas[company_name] = formula
+
+
+def set_formula(company_name, formula):
+    """
+    scenario that switches a company to a different pricing formula
+    """
+    return partial(_set_formula, company_name=company_name, formula=formula)
+
+
+def run_branch(checkpoint_path, branch_path, scenario, n_periods, seed=None):
+    """
+    restore a checkpoint into branch_path, apply scenario to the simulation and run it forward.
+    scenario is any picklable callable that takes the simulation, such as set_formula. seed
+    reseeds the generators of god and the broker, as Simulation.reset does
+    """
+    with working_directory(branch_path):
+        simulation = load_checkpoint(checkpoint_path, copy_function=clone_file)
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+            # events foreseen before the checkpoint are drawn again from the branch's seed
+            simulation.god.forget()
+            simulation.god.rng = np.random.default_rng(seed)
+            simulation.broker.rng = np.random.default_rng(broker_seed(seed))
+        if scenario is not None:
+            scenario(simulation)
+        simulation.run(n_periods)
+        return simulation.policy_count
+
+
+def fork_scenarios(
+        checkpoint_path,
+        scenarios,
+        n_periods,
+        branch_dir='branches',
+        max_workers=None,
+        seeds=None
+):
+    """
+    run each scenario in scenarios, a dict of scenario name to scenario, from the same
+    checkpoint in its own process and directory under branch_dir. branches share the
+    checkpoint's history and all start from its random state unless seeds gives one per scenario.
+    returns the market share history of every branch, labelled by scenario
+    """
+    checkpoint_path = os.path.abspath(checkpoint_path)
+    if seeds is None:
+        seeds = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(
+                run_branch,
+                checkpoint_path,
+                os.path.abspath(os.path.join(branch_dir, name)),
+                scenario,
+                n_periods,
+                seeds.get(name)
+            )
+            for name, scenario in scenarios.items()
+        }
+        results = []
+        for name, future in futures.items():
+            result = future.result()
+            result.insert(0, 'scenario', name)
+            results.append(result)
+
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,122 @@
+# run a grid of isolated simulations on a worker pool
+import itertools
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+
+from mies.simulation import Simulation
+from mies.utilities.scenarios import working_directory
+
+
+def make_grid(
+        formulas,
+        var_powers=(1.5,),
+        population_sizes=(1000,),
+        replications=1
+):
+    """
+    every combination of the sweep parameters, one dict per run, each repeated for replications
+    replications. formulas maps a label to a dict of company name to pricing formula, such as
+    {'company_1': ..., 'company_2': ...}
+    """
+    grid = itertools.product(
+        formulas.items(),
+        var_powers,
+        population_sizes,
+        range(replications)
+    )
+    return [
+        {
+            'run_id': run_id,
+            'formula_set': label,
+            'formulas': company_formulas,
+            'var_power': var_power,
+            'n_people': n_people,
+            'replication': replication
+        }
+        for run_id, ((label, company_formulas), var_power, n_people, replication) in enumerate(grid)
+    ]
+
+
+def run_simulation(run, n_periods, backend='memory', sweep_dir='sweeps', seed=None):
+    """
+    run one point of the grid in its own directory and return its history in long format,
+    one row per year and company. runs of the same replication share their seed, so that
+    they draw the same population and losses where their population sizes agree
+    """
+    if seed is not None:
+        seed = seed + run['replication']
+    with working_directory(os.path.join(sweep_dir, 'run_' + str(run['run_id']))):
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        start = time.perf_counter()
+        simulation = Simulation(
+            formulas=run['formulas'],
+            n_people=run['n_people'],
+            backend=backend,
+            var_power=run['var_power'],
+            seed=seed
+        )
+        setup_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        simulation.run(n_periods, foresee=True)
+        run_seconds = time.perf_counter() - start
+
+    history = simulation.policy_count
+    results = []
+    for company_name in run['formulas']:
+        company = history[['year', company_name, company_name + '_prem']].copy()
+        company.columns = ['year', 'policy_count', 'average_premium']
+        company.insert(1, 'company_name', company_name)
+        results.append(company)
+    results = pd.concat(results, ignore_index=True)
+
+    results.insert(0, 'run_id', run['run_id'])
+    results.insert(1, 'formula_set', run['formula_set'])
+    results.insert(2, 'var_power', run['var_power'])
+    results.insert(3, 'n_people', run['n_people'])
+    results.insert(4, 'replication', run['replication'])
+    results['market_share'] = results['policy_count'] / run['n_people']
+    results['setup_seconds'] = setup_seconds
+    results['run_seconds'] = run_seconds
+    return results
+
+
+def run_sweep(
+        formulas,
+        var_powers=(1.5,),
+        population_sizes=(1000,),
+        replications=1,
+        n_periods=50,
+        backend='memory',
+        sweep_dir='sweeps',
+        max_workers=None,
+        seed=None
+):
+    """
+    run every combination of pricing formulas, tweedie variance powers and population
+    sizes, replications times each, as an isolated simulation on a process pool. with seed,
+    the runs of a replication draw the same people and losses, so that the differences between
+    combinations are not sampling noise, while each replication draws new ones. returns one
+    tidy table with a row per run, year and company, along with the setup and run time of each
+    run. runs on the sqlite backend each keep their databases in their own directory under sweep_dir
+    """
+    grid = make_grid(formulas, var_powers, population_sizes, replications)
+    sweep_dir = os.path.abspath(sweep_dir)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_simulation, run, n_periods, backend, sweep_dir, seed)
+            for run in grid
+        ]
+        results = [future.result() for future in futures]
+
+    return pd.concat(results, ignore_index=True)
@@ -0,0 +1,41 @@
+# common shocks load the losses of everyone they affect in the periods they strike
+import datetime as dt
+import time
+import numpy as np
+import pandas as pd
+import parameters as pm
+
+from mies.entities.god import draw_events, generate_population
+from mies.models.catastrophe import CatastropheModel
+from mies.models.losses import build_frequency_model, build_severity_model
+from mies.models.samplers import build_samplers
+
+rng = np.random.default_rng(1)
+population = pd.concat(
+    generate_population(10000000, rng, build_samplers(pm.population_samplers), 1000000),
+    ignore_index=True
+)[['risk_cell']]
+population['person_id'] = np.arange(1, len(population) + 1)
+
+catastrophes = CatastropheModel([
+    {'name': 'epidemic', 'probability': .2, 'affected': {'health_status': ['P']},
+     'frequency_loading': 3, 'severity_loading': 1.5},
+    {'name': 'layoffs', 'probability': .1, 'affected': {'profession': ['B']}, 'frequency_loading': 2}
+])
+event_dates = [dt.date(2000 + year, 1, 1) for year in range(10)]
+
+start = time.time()
+strikes, frequency_loadings, severity_loadings = catastrophes.sample(len(event_dates), rng)
+events, period = draw_events(
+    population,
+    event_dates,
+    rng,
+    build_frequency_model(pm.frequency_model),
+    build_severity_model(pm.severity_model),
+    frequency_loadings=frequency_loadings,
+    severity_loadings=severity_loadings
+)
+print(time.time() - start)
+
+print(catastrophes.strike_frame(strikes, event_dates))
+print(events.groupby(period)['ground_up_loss'].agg(['size', 'sum']))
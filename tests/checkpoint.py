@@ -0,0 +1,25 @@
+# a run resumed from a checkpoint should continue exactly as the uninterrupted run
+import random
+import numpy as np
+
+from mies.simulation import Simulation
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+random.seed(1)
+np.random.seed(1)
+simulation = Simulation(formulas, n_people=200, seed=1)
+simulation.run(2, checkpoint_dir='checkpoints')
+simulation.run(1)
+uninterrupted = simulation.policy_count
+
+resumed = Simulation.resume('checkpoints/period_2')
+resumed.run(1)
+
+# should be True
+print(resumed.policy_count.equals(uninterrupted))
+
+resumed.god.annihilate()
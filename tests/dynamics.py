@@ -0,0 +1,31 @@
+# the population ages, changes health, earns more and turns over between periods
+from mies.simulation import Simulation
+from mies.utilities.queries import query_population
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+dynamics = [
+    ('markov', {'attribute': 'age_class', 'transitions': [[.9, .1, 0], [0, .95, .05], [0, 0, 1]]}),
+    ('markov', {'attribute': 'health_status', 'transitions': [[.8, .2, 0], [.1, .8, .1], [0, .2, .8]]}),
+    ('growth', {'attribute': 'income', 'rate': .02, 'sigma': .1}),
+    ('exit', {'probability': [.01, .02, .1], 'given': 'age_class'}),
+    ('entry', {'rate': .05})
+]
+
+simulation = Simulation(formulas, n_people=1000, seed=1, dynamics=dynamics)
+print(query_population()['age_class'].value_counts())
+
+simulation.run(5)
+print(simulation.policy_count)
+
+population = query_population()
+print(population['age_class'].value_counts())
+print(population['income'].mean())
+
+# should be True
+print(set(population['person_id']) == set(simulation.person_ids))
+
+simulation.god.annihilate()
@@ -0,0 +1,17 @@
+# people choose among the quotes with multinomial logit probabilities, favouring their insurer
+from mies.simulation import Simulation
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class',
+    'company_3': 'incurred_loss ~ profession + health_status'
+}
+
+simulation = Simulation(formulas, n_people=1000, seed=1, placement='logit')
+simulation.broker.price_sensitivity = 5
+simulation.broker.loyalty = 1
+
+simulation.run(5)
+print(simulation.policy_count)
+
+simulation.god.annihilate()
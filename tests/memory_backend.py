@@ -0,0 +1,24 @@
+# run a simulation entirely in memory and write the final state out in the sqlite schema
+import time
+
+from mies.simulation import Simulation
+from mies.utilities.queries import query_pricing_model_data
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+start = time.time()
+simulation = Simulation(formulas, n_people=10000, backend='memory')
+simulation.run(10)
+print(time.time() - start)
+print(simulation.policy_count)
+
+simulation.god.persist('db')
+
+# the persisted tables can be read with the usual queries
+print(query_pricing_model_data('company_1').head())
+
+# should be True, keys stay integer however the tables were first read
+print(simulation.insurers[0].policy.frame['person_id'].dtype.kind == 'i')
@@ -0,0 +1,29 @@
+# insurers quote renewals concurrently, in threads or in worker processes
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from mies.models.market import quote_matrix
+from mies.simulation import Simulation
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class',
+    'company_3': 'incurred_loss ~ profession + health_status'
+}
+
+if __name__ == '__main__':
+    with ThreadPoolExecutor(4) as executor:
+        simulation = Simulation(formulas, n_people=1000, seed=1, quote_executor=executor)
+        simulation.run(3)
+        print(simulation.policy_count)
+
+    free_business = simulation.broker.identify_free_business(simulation.pricing_date)
+    serial = quote_matrix(free_business, simulation.insurers)
+    with ProcessPoolExecutor(2) as executor:
+        parallel = quote_matrix(free_business, simulation.insurers, executor)
+
+    # should be True
+    print(np.allclose(serial, parallel))
+
+    simulation.god.annihilate()
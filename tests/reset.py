@@ -0,0 +1,38 @@
+# replications reset the universe in place instead of rebuilding it
+import random
+import time
+import numpy as np
+
+from mies.simulation import Simulation
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+random.seed(1)
+np.random.seed(1)
+simulation = Simulation(formulas, n_people=200, seed=1)
+simulation.run(3)
+first = simulation.policy_count
+
+# redrawing the population from the same seeds repeats the first replication
+random.seed(1)
+np.random.seed(1)
+start = time.time()
+simulation.reset(keep_population=False, seed=1)
+print(time.time() - start)
+simulation.run(3)
+
+# should be True
+print(simulation.policy_count.equals(first))
+
+# keeping the population, each replication only draws new losses
+for replication in range(3):
+    start = time.time()
+    simulation.reset(seed=replication)
+    print(time.time() - start)
+    simulation.run(3)
+    print(simulation.policy_count)
+
+simulation.god.annihilate()
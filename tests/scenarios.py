@@ -0,0 +1,24 @@
+# fork what-if branches from a shared warm-up period
+from mies.simulation import Simulation
+from mies.utilities.scenarios import fork_scenarios, set_formula
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+simulation = Simulation(formulas, n_people=500)
+simulation.run(5, checkpoint_dir='checkpoints')
+
+branches = fork_scenarios(
+    'checkpoints/period_5',
+    {
+        'baseline': None,
+        'company_2_full_formula': set_formula('company_2', formulas['company_1'])
+    },
+    n_periods=10
+)
+
+# histories should be identical through year 7, since a new formula only changes the quotes
+# placed the period after it is applied, and diverge afterwards
+print(branches.pivot(index='year', columns='scenario', values='company_2'))
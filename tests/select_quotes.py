@@ -0,0 +1,30 @@
+# winning quotes map back to the right company however many insurers quote
+import numpy as np
+
+from mies.models.market import select_quotes
+
+rng = np.random.default_rng(1)
+company_ids = np.arange(101, 113)
+n_people = len(company_ids)
+
+# each row is won by a different column, including columns 10 and 11
+quotes = np.full((n_people, len(company_ids)), 1000.)
+quotes[np.arange(n_people), np.arange(n_people)] = 500.
+premiums, winning_ids = select_quotes(quotes, company_ids, 'first')
+# should be True
+print(np.array_equal(winning_ids, company_ids), np.all(premiums == 500.))
+
+# ties between columns 2, 10 and 11 go to the first of them, or to each of them at random
+quotes = np.full((10000, len(company_ids)), 1000.)
+quotes[:, [2, 10, 11]] = 500.
+premiums, winning_ids = select_quotes(quotes, company_ids, 'first')
+# should be True
+print(np.all(winning_ids == company_ids[2]))
+premiums, winning_ids = select_quotes(quotes, company_ids, 'random', rng)
+shares = np.array([np.mean(winning_ids == company_ids[k]) for k in [2, 10, 11]])
+# should be True, only the tied companies win, about a third of the time each
+print(np.isin(winning_ids, company_ids[[2, 10, 11]]).all(), np.allclose(shares, 1 / 3, atol=.02))
+
+# should be True, rows without a finite quote go to no company
+premiums, winning_ids = select_quotes(np.full((2, len(company_ids)), np.nan), company_ids)
+print(np.all(winning_ids == -1), np.isnan(premiums).all())
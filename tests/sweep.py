@@ -0,0 +1,21 @@
+# market share under each pricing formula split, variance power and population size
+from mies.utilities.sweep import run_sweep
+
+full_formula = 'incurred_loss ~ age_class + profession + health_status + education_level'
+age_formula = 'incurred_loss ~ age_class'
+
+results = run_sweep(
+    formulas={
+        'full_vs_age': {'company_1': full_formula, 'company_2': age_formula},
+        'age_vs_full': {'company_1': age_formula, 'company_2': full_formula}
+    },
+    var_powers=[1.1, 1.5, 1.9],
+    population_sizes=[1000, 5000],
+    replications=2,
+    n_periods=20,
+    seed=1
+)
+
+final = results[results['year'] == results['year'].max()]
+print(final.groupby(['formula_set', 'var_power', 'n_people', 'company_name'])['market_share'].mean())
+print(results.groupby('run_id')[['setup_seconds', 'run_seconds']].first())
@@ -0,0 +1,27 @@
+# people buy insurance when their Cobb-Douglas demand at the premium comes to take_up's threshold
+import numpy as np
+import pandas as pd
+
+import parameters as pm
+from mies.models.market import take_up
+
+rng = np.random.default_rng(1)
+people = pd.DataFrame({
+    'income': rng.pareto(3, size=100000) * pm.person_params['income'],
+    'cobb_c': pm.person_params['cobb_c'],
+    'cobb_d': pm.person_params['cobb_d']
+})
+share = people['cobb_c'] / (people['cobb_c'] + people['cobb_d'])
+
+for premium in [1000, 4000, 16000]:
+    for threshold in [.5, 1, 2]:
+        rate = take_up(people, np.full(len(people), premium), threshold).mean()
+        # should be True, the rate is that of people whose insurance budget covers threshold policies
+        print(premium, threshold, rate, rate == (share * people['income'] >= threshold * premium).mean())
+
+# should be True, take-up falls as premiums rise and rises with income
+rates = [take_up(people, np.full(len(people), premium)).mean() for premium in [1000, 4000, 16000]]
+print(rates[0] >= rates[1] >= rates[2])
+rich = people['income'] > people['income'].median()
+bought = take_up(people, np.full(len(people), 4000))
+print(bought[rich].mean() >= bought[~rich].mean())
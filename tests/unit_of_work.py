@@ -0,0 +1,46 @@
+# a period that fails part way leaves every database as it was before the period
+import datetime as dt
+
+import pandas as pd
+
+from mies.simulation import Simulation
+from mies.utilities.queries import query_events_by_report_day
+
+formulas = {
+    'company_1': 'incurred_loss ~ age_class + profession + health_status + education_level',
+    'company_2': 'incurred_loss ~ age_class'
+}
+
+simulation = Simulation(formulas, n_people=1000, seed=1)
+simulation.run(2)
+n_events = len(query_events_by_report_day(1, dt.date.max.toordinal()))
+reported_through = simulation.broker.reported_through
+
+
+def fail(*args):
+    raise RuntimeError('pricing failed')
+
+
+simulation.insurers[1].price_book = fail
+try:
+    simulation.run_period()
+except RuntimeError as error:
+    print(error)
+
+# should be True, the events drawn in the failed period were rolled back
+print(len(query_events_by_report_day(1, dt.date.max.toordinal())) == n_events)
+# should be True, and so was the broker's watermark of reported events
+print(simulation.broker.reported_through == reported_through)
+
+# once pricing works again the period can be run again, and its events all become claims
+del simulation.insurers[1].price_book
+simulation.run_period()
+n_events = len(query_events_by_report_day(1, dt.date.max.toordinal()))
+n_claims = sum(
+    len(pd.read_sql('SELECT claim_id FROM claim', insurer.connection))
+    for insurer in simulation.insurers
+)
+# should be True
+print(n_claims == n_events, simulation.period == 3)
+
+simulation.god.annihilate()